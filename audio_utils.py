@@ -0,0 +1,227 @@
+import base64
+import time
+import numpy as np
+
+# Twilio media streams are 8 kHz mono G.711 μ-law, 20 ms (160 byte) frames
+TWILIO_SAMPLE_RATE = 8000
+SAMPLES_PER_MS = TWILIO_SAMPLE_RATE // 1000
+
+ULAW_BIAS = 0x84
+ULAW_BIAS_14 = 0x21
+ULAW_CLIP_14 = 8159
+SILENCE_THRESHOLD_DBFS = -40.0  # Frames quieter than this count as silence
+CLIPPING_THRESHOLD = 32000  # Samples at or above this magnitude count as clipped
+LEVEL_SMOOTHING = 0.1  # Weight of the newest frame in the rolling level
+
+
+def _build_decode_table() -> np.ndarray:
+    """Build the 256-entry μ-law byte -> PCM16 sample table."""
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    sign = codes & 0x80
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + ULAW_BIAS) << exponent) - ULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table() -> np.ndarray:
+    """
+    Build the 65536-entry PCM16 sample -> μ-law byte table, indexed by the uint16
+    view of the sample. Bit-exact with the stdlib audioop.lin2ulaw (removed in 3.13).
+    """
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples) >> 2  # 14-bit
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), ULAW_CLIP_14) + ULAW_BIAS_14
+    exponent = np.clip(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 0, 7)
+    mantissa = (magnitude >> (exponent + 1)) & 0x0F
+    codes = np.where(magnitude > 0x1FFF, 0x7F, (exponent << 4) | mantissa)
+    return (codes ^ mask).astype(np.uint8)
+
+
+ULAW_TO_PCM16 = _build_decode_table()
+PCM16_TO_ULAW = _build_encode_table()
+
+# Per-byte lookups so frame statistics never need a decoded copy of the audio
+ULAW_ENERGY = ULAW_TO_PCM16.astype(np.float64) ** 2
+ULAW_MAGNITUDE = np.abs(ULAW_TO_PCM16.astype(np.int32))
+ULAW_CLIPPED = ULAW_MAGNITUDE >= CLIPPING_THRESHOLD
+
+
+def payload_view(payload: str) -> memoryview:
+    """
+    Decode a base64 Twilio/OpenAI audio payload into a memoryview over the raw μ-law bytes.
+    The view shares the decoded buffer, so wrapping it with NumPy does not copy again.
+    """
+    return memoryview(base64.b64decode(payload))
+
+
+def ulaw_codes(payload) -> np.ndarray:
+    """Return the μ-law bytes of a payload (base64 string, bytes or memoryview) as a uint8 array without copying."""
+    if isinstance(payload, str):
+        payload = payload_view(payload)
+    return np.frombuffer(payload, dtype=np.uint8)
+
+
+def ulaw_to_pcm16(payload) -> np.ndarray:
+    """Decode μ-law audio into PCM16 samples."""
+    return ULAW_TO_PCM16[ulaw_codes(payload)]
+
+
+def pcm16_to_ulaw(samples: np.ndarray) -> bytes:
+    """Encode PCM16 samples into μ-law bytes."""
+    samples = np.asarray(samples, dtype=np.int16)
+    return PCM16_TO_ULAW[samples.view(np.uint16)].tobytes()
+
+
+def pcm16_to_payload(samples: np.ndarray) -> str:
+    """Encode PCM16 samples into a base64 μ-law payload ready for Twilio."""
+    return base64.b64encode(pcm16_to_ulaw(samples)).decode("ascii")
+
+
+def resample(samples: np.ndarray, src_rate: int = TWILIO_SAMPLE_RATE, dst_rate: int = 16000) -> np.ndarray:
+    """
+    Resample PCM16 audio with linear interpolation, e.g. 8 kHz -> 16/24 kHz for
+    models that expect wideband PCM.
+    """
+    samples = np.asarray(samples, dtype=np.int16)
+    if src_rate == dst_rate or samples.size == 0:
+        return samples.copy()
+
+    out_len = int(round(samples.size * dst_rate / src_rate))
+    positions = np.arange(out_len, dtype=np.float64) * (src_rate / dst_rate)
+    resampled = np.interp(positions, np.arange(samples.size), samples.astype(np.float64))
+    return np.clip(np.rint(resampled), -32768, 32767).astype(np.int16)
+
+
+def _to_dbfs(mean_square: float) -> float:
+    if mean_square <= 0:
+        return float("-inf")
+    return float(10 * np.log10(mean_square / 32768.0 ** 2))
+
+
+def _finite_or_none(value: float):
+    return value if np.isfinite(value) else None
+
+
+class AudioDirectionStats:
+    """Running level, silence and clipping counters for one direction of a call."""
+
+    __slots__ = ("frames", "samples", "energy", "peak", "clipped_samples",
+                 "silent_samples", "level_dbfs")
+
+    def __init__(self):
+        self.frames = 0
+        self.samples = 0
+        self.energy = 0.0
+        self.peak = 0
+        self.clipped_samples = 0
+        self.silent_samples = 0
+        self.level_dbfs = float("-inf")  # Exponentially smoothed frame level
+
+    def add(self, codes: np.ndarray):
+        n = codes.size
+        if n == 0:
+            return
+        energy = float(ULAW_ENERGY[codes].sum())
+        frame_dbfs = _to_dbfs(energy / n)
+
+        self.frames += 1
+        self.samples += n
+        self.energy += energy
+        self.peak = max(self.peak, int(ULAW_MAGNITUDE[codes].max()))
+        self.clipped_samples += int(np.count_nonzero(ULAW_CLIPPED[codes]))
+        if frame_dbfs < SILENCE_THRESHOLD_DBFS:
+            self.silent_samples += n
+
+        if self.level_dbfs == float("-inf"):
+            self.level_dbfs = frame_dbfs
+        elif frame_dbfs != float("-inf"):
+            self.level_dbfs += LEVEL_SMOOTHING * (frame_dbfs - self.level_dbfs)
+
+    def summary(self) -> dict:
+        duration_ms = self.samples / SAMPLES_PER_MS
+        return {
+            "frames": self.frames,
+            "duration_ms": duration_ms,
+            "talk_ms": (self.samples - self.silent_samples) / SAMPLES_PER_MS,
+            "rms_dbfs": _finite_or_none(_to_dbfs(self.energy / self.samples)) if self.samples else None,
+            "level_dbfs": _finite_or_none(self.level_dbfs),
+            "peak": self.peak,
+            "silence_ratio": self.silent_samples / self.samples if self.samples else 0.0,  # Deltas vary in size
+            "clipping_ratio": self.clipped_samples / self.samples if self.samples else 0.0,
+        }
+
+
+class CallAudioStats:
+    """
+    Per-call audio analytics, fed with the raw base64 payloads relayed by
+    receive_from_twilio (caller) and send_to_twilio (assistant).
+    """
+
+    def __init__(self):
+        self.inbound = AudioDirectionStats()
+        self.outbound = AudioDirectionStats()
+        self.processing_ns = 0  # Time spent in this accumulator, for overhead tracking
+
+    def add_inbound(self, payload):
+        start = time.perf_counter_ns()
+        self.inbound.add(ulaw_codes(payload))
+        self.processing_ns += time.perf_counter_ns() - start
+
+    def add_outbound(self, payload):
+        start = time.perf_counter_ns()
+        self.outbound.add(ulaw_codes(payload))
+        self.processing_ns += time.perf_counter_ns() - start
+
+    def summary(self) -> dict:
+        inbound = self.inbound.summary()
+        outbound = self.outbound.summary()
+        total_talk = inbound["talk_ms"] + outbound["talk_ms"]
+        return {
+            "caller": inbound,
+            "assistant": outbound,
+            "caller_talk_share": inbound["talk_ms"] / total_talk if total_talk else 0.0,
+            "processing_ms": self.processing_ns / 1e6,
+        }
+
+
+def benchmark(frames: int = 20000):
+    """
+    Measure the per-frame cost of the analytics path against the 20 ms frame
+    budget. Run with `python audio_utils.py`.
+    """
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(160 * frames) * 3000).astype(np.int16)
+    payloads = [pcm16_to_payload(pcm[i * 160:(i + 1) * 160]) for i in range(frames)]
+    frame_budget_ns = 20_000_000
+
+    stats = CallAudioStats()
+    start = time.perf_counter_ns()
+    for payload in payloads:
+        stats.add_inbound(payload)
+    per_frame = (time.perf_counter_ns() - start) / frames
+    print(f"stats per 20 ms frame:     {per_frame / 1000:8.2f} us  ({per_frame / frame_budget_ns:.3%} of a core)")
+
+    start = time.perf_counter_ns()
+    for payload in payloads:
+        ulaw_to_pcm16(payload)
+    per_frame = (time.perf_counter_ns() - start) / frames
+    print(f"decode per 20 ms frame:    {per_frame / 1000:8.2f} us  ({per_frame / frame_budget_ns:.3%} of a core)")
+
+    samples = pcm[:160]
+    start = time.perf_counter_ns()
+    for _ in range(frames):
+        pcm16_to_ulaw(samples)
+    per_frame = (time.perf_counter_ns() - start) / frames
+    print(f"encode per 20 ms frame:    {per_frame / 1000:8.2f} us  ({per_frame / frame_budget_ns:.3%} of a core)")
+
+    start = time.perf_counter_ns()
+    for _ in range(frames):
+        resample(samples, dst_rate=24000)
+    per_frame = (time.perf_counter_ns() - start) / frames
+    print(f"resample 8k->24k per frame:{per_frame / 1000:8.2f} us  ({per_frame / frame_budget_ns:.3%} of a core)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,257 @@
+# Per-call usage and cost accounting. Each call's counters are collected in memory by
+# the send_to_twilio dispatcher and, when the call ends, written to a local SQLite store
+# that keeps one row per call plus running per-day, per-user aggregates.
+#
+# Benchmark: python call_accounting.py [--calls 30000]
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+USAGE_DB_PATH = os.getenv("USAGE_DB_PATH", "call_usage.db")
+
+# USD per 1M tokens for gpt-4o-realtime-preview-2024-10-01
+TOKEN_PRICES = {
+    "input_text_tokens": 5.00,
+    "input_audio_tokens": 100.00,
+    "cached_text_tokens": 2.50,
+    "cached_audio_tokens": 20.00,
+    "output_text_tokens": 20.00,
+    "output_audio_tokens": 200.00,
+}
+
+# Summed columns, shared by the per-call table and the daily aggregates. Memory columns count
+# turns queued in the memory outbox and local index lookups. mem0_calls counts the Mem0 add()
+# calls that shipped the call's turns, added as the outbox ships them, possibly after the call
+# has ended. Index fetches (get_all) are per user rather than per call and are only counted
+# process-wide on /diagnostics.
+USAGE_FIELDS = (
+    "duration_s", "audio_in_ms", "audio_out_ms", "responses", "cancelled_responses", "interruptions",
+    "input_tokens", "output_tokens", "input_text_tokens", "input_audio_tokens",
+    "cached_text_tokens", "cached_audio_tokens", "output_text_tokens", "output_audio_tokens",
+    "memory_turns_queued", "memory_index_lookups", "mem0_calls", "cost_usd",
+)
+
+
+class CallUsage:
+    """Compact per-call counters, fed one realtime event at a time."""
+
+    __slots__ = ("stream_sid", "phone_number", "started_at") + USAGE_FIELDS
+
+    def __init__(self):
+        self.stream_sid = None
+        self.phone_number = None
+        self.started_at = time.time()
+        for field in USAGE_FIELDS:
+            setattr(self, field, 0)
+
+    def record_event(self, event: dict):
+        """Account for an OpenAI realtime event; only response.done carries usage."""
+        if event.get("type") != "response.done":
+            return
+        response = event.get("response") or {}
+        self.responses += 1
+        if response.get("status") == "cancelled":
+            self.cancelled_responses += 1
+
+        usage = response.get("usage") or {}
+        input_details = usage.get("input_token_details") or {}
+        cached_details = input_details.get("cached_tokens_details") or {}
+        output_details = usage.get("output_token_details") or {}
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.output_tokens += usage.get("output_tokens", 0)
+        self.input_text_tokens += input_details.get("text_tokens", 0)
+        self.input_audio_tokens += input_details.get("audio_tokens", 0)
+        self.cached_text_tokens += cached_details.get("text_tokens", 0)
+        self.cached_audio_tokens += cached_details.get("audio_tokens", 0)
+        self.output_text_tokens += output_details.get("text_tokens", 0)
+        self.output_audio_tokens += output_details.get("audio_tokens", 0)
+
+    def finish(self, audio_summary: dict = None, memory_index_lookups: int = 0):
+        """Fill in the end-of-call fields and the estimated cost."""
+        self.duration_s = time.time() - self.started_at
+        if audio_summary:
+            self.audio_in_ms = audio_summary["caller"]["duration_ms"]
+            self.audio_out_ms = audio_summary["assistant"]["duration_ms"]
+        self.memory_index_lookups += memory_index_lookups
+        # Cached tokens are also counted in the text/audio totals, so bill them at the difference
+        self.cost_usd = sum(getattr(self, field) * price for field, price in TOKEN_PRICES.items()) / 1e6
+        self.cost_usd -= (self.cached_text_tokens * TOKEN_PRICES["input_text_tokens"]
+                          + self.cached_audio_tokens * TOKEN_PRICES["input_audio_tokens"]) / 1e6
+
+    def snapshot(self) -> dict:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+class UsageStore:
+    """SQLite store with a row per call and per-day, per-user aggregates maintained on insert."""
+
+    def __init__(self, path: str = USAGE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        columns = ", ".join(f"{field} REAL NOT NULL DEFAULT 0" for field in USAGE_FIELDS)
+        self._connection().executescript(f"""
+            CREATE TABLE IF NOT EXISTS call_usage (
+                stream_sid TEXT PRIMARY KEY, user_id TEXT, day TEXT NOT NULL, started_at REAL NOT NULL, {columns}
+            );
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                day TEXT NOT NULL, user_id TEXT NOT NULL, calls INTEGER NOT NULL DEFAULT 0, {columns},
+                PRIMARY KEY (day, user_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pending_mem0_calls (
+                stream_sid TEXT PRIMARY KEY, calls INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, usage: CallUsage):
+        self.record_many([usage])
+
+    def record_many(self, usages):
+        """Insert finished calls and fold them into the daily aggregates in one transaction."""
+        placeholders = ", ".join("?" for _ in USAGE_FIELDS)
+        fields = ", ".join(USAGE_FIELDS)
+        rollup = ", ".join(f"{field} = {field} + excluded.{field}" for field in USAGE_FIELDS)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for usage in usages:
+                day = datetime.fromtimestamp(usage.started_at).strftime("%Y-%m-%d")
+                pending = conn.execute(
+                    "DELETE FROM pending_mem0_calls WHERE stream_sid = ? RETURNING calls", (usage.stream_sid,)
+                ).fetchone()
+                if pending:
+                    usage.mem0_calls += pending[0]  # Shipped while the call was still in progress
+                values = [getattr(usage, field) for field in USAGE_FIELDS]
+                inserted = conn.execute(
+                    f"INSERT OR IGNORE INTO call_usage (stream_sid, user_id, day, started_at, {fields}) "
+                    f"VALUES (?, ?, ?, ?, {placeholders})",
+                    [usage.stream_sid, usage.phone_number, day, usage.started_at, *values],
+                ).rowcount
+                if not inserted:
+                    continue  # Already accounted for
+                conn.execute(
+                    f"INSERT INTO daily_usage (day, user_id, calls, {fields}) VALUES (?, ?, 1, {placeholders}) "
+                    f"ON CONFLICT (day, user_id) DO UPDATE SET calls = calls + 1, {rollup}",
+                    [day, usage.phone_number or "", *values],
+                )
+
+    def record_mem0_calls(self, stream_sid: str, calls: int = 1):
+        """
+        Add shipped Mem0 calls to a call and its daily aggregate. Calls for a call that
+        has not been recorded yet are kept aside and folded in by record_many().
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT day, user_id FROM call_usage WHERE stream_sid = ?", (stream_sid,)).fetchone()
+            if row is None:
+                conn.execute(
+                    "INSERT INTO pending_mem0_calls (stream_sid, calls) VALUES (?, ?) "
+                    "ON CONFLICT (stream_sid) DO UPDATE SET calls = calls + excluded.calls",
+                    (stream_sid, calls),
+                )
+                return
+            day, user_id = row
+            conn.execute("UPDATE call_usage SET mem0_calls = mem0_calls + ? WHERE stream_sid = ?", (calls, stream_sid))
+            conn.execute("UPDATE daily_usage SET mem0_calls = mem0_calls + ? WHERE day = ? AND user_id = ?",
+                         (calls, day, user_id or ""))
+
+    def iter_usage(self, group_by: str = "day", start: str = None, end: str = None):
+        """
+        Stream aggregated usage grouped by "day", "user" or "day_user", optionally
+        limited to days in [start, end] (YYYY-MM-DD). Reads only the daily aggregates.
+        """
+        keys = {"day": "day", "user": "user_id", "day_user": "day, user_id"}[group_by]
+        sums = ", ".join(f"SUM({field}) AS {field}" for field in USAGE_FIELDS)
+        query = f"SELECT {keys}, SUM(calls) AS calls, {sums} FROM daily_usage WHERE day >= ? AND day <= ? " \
+                f"GROUP BY {keys} ORDER BY {keys}"
+        cursor = self._connection().execute(query, (start or "0000-00-00", end or "9999-99-99"))
+        names = [column[0] for column in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
+
+
+_usage_store = None
+_usage_store_lock = threading.Lock()
+
+
+def get_usage_store() -> UsageStore:
+    """Return the shared usage store, opening it on first use."""
+    global _usage_store
+    if _usage_store is None:
+        with _usage_store_lock:
+            if _usage_store is None:
+                _usage_store = UsageStore()
+    return _usage_store
+
+
+def get_stats(group_by: str = "day", start: str = None, end: str = None):
+    """
+    Stats endpoint: call counts, audio minutes, tokens and estimated cost per day or per user.
+    A plain function, so FastAPI runs the SQLite queries in its threadpool rather than on the event loop.
+    """
+    if group_by not in ("day", "user", "day_user"):
+        return {"error": "group_by must be one of day, user, day_user", "status": 400}
+    rows = []
+    for row in get_usage_store().iter_usage(group_by, start, end):
+        row["audio_in_minutes"] = row["audio_in_ms"] / 60000
+        row["audio_out_minutes"] = row["audio_out_ms"] / 60000
+        rows.append(row)
+    return {"group_by": group_by, "start": start, "end": end, "rows": rows}
+
+
+def benchmark(calls: int = 30_000, users: int = 200):
+    """Record a month of synthetic calls and time the per-day and per-user aggregations."""
+    import random
+    import tempfile
+
+    random.seed(0)
+    month_start = time.mktime((2024, 11, 1, 0, 0, 0, 0, 0, -1))
+    usages = []
+    for i in range(calls):
+        usage = CallUsage()
+        usage.stream_sid = f"MZ{i:032x}"
+        usage.phone_number = f"+1555{random.randrange(users):07d}"
+        usage.started_at = month_start + random.random() * 30 * 86400
+        for _ in range(random.randint(3, 30)):
+            usage.record_event({"type": "response.done", "response": {"status": "completed", "usage": {
+                "input_tokens": 900, "output_tokens": 300,
+                "input_token_details": {"text_tokens": 700, "audio_tokens": 200,
+                                        "cached_tokens_details": {"text_tokens": 500, "audio_tokens": 0}},
+                "output_token_details": {"text_tokens": 60, "audio_tokens": 240}}}})
+        usage.finish({"caller": {"duration_ms": 120000}, "assistant": {"duration_ms": 90000}})
+        usages.append(usage)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = UsageStore(os.path.join(directory, "usage.db"))
+        start = time.perf_counter()
+        store.record_many(usages)
+        print(f"record {calls} calls:       {time.perf_counter() - start:8.3f} s")
+        for group_by in ("day", "user", "day_user"):
+            start = time.perf_counter()
+            rows = list(store.iter_usage(group_by, "2024-11-01", "2024-11-30"))
+            print(f"aggregate by {group_by:<9} {(time.perf_counter() - start) * 1000:8.2f} ms ({len(rows)} rows)")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark call usage aggregation")
+    parser.add_argument("--calls", type=int, default=30_000)
+    args = parser.parse_args()
+    benchmark(args.calls)
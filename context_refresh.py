@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from openai_session import conversation_item
+
+# Mid-call memory refresh settings
+CONTEXT_REFRESH_INTERVAL = float(os.getenv("CONTEXT_REFRESH_INTERVAL", 10))  # Minimum seconds between pushes
+CONTEXT_REFRESH_MAX_MEMORIES = 3  # Memories added per push
+CONTEXT_LOOKUP_LIMIT = 8  # Candidates fetched per lookup, before dropping ones already in the session
+MIN_TRANSCRIPT_WORDS = 3  # Shorter utterances ("yes", "uh huh") don't trigger a lookup
+LOOKUP_CACHE_SIZE = 64
+
+
+class ContextRefresher:
+    """
+    Watches the caller's transcripts during a call and feeds related memories back
+    into the live session as small system conversation items.
+
+    Lookups run in a background task on the default executor, so relaying audio
+    never waits on them. Pushes are rate-limited; transcripts arriving in the
+    meantime are coalesced so only the latest one is looked up.
+    """
+
+    def __init__(self, openai_ws, lookup, initial_memories=None,
+                 min_interval: float = CONTEXT_REFRESH_INTERVAL,
+                 max_memories: int = CONTEXT_REFRESH_MAX_MEMORIES):
+        self.openai_ws = openai_ws
+        self.lookup = lookup  # lookup(phone_number, limit, query) -> list of memory texts
+        self.min_interval = min_interval
+        self.max_memories = max_memories
+        self.injected = set(initial_memories or [])  # Memories the session already has
+        self._cache = OrderedDict()  # Normalized transcript -> lookup results
+        self._pending = None
+        self._task = None
+        self._last_push = float("-inf")
+
+        self.lookups = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.pushes = 0
+        self.memories_pushed = 0
+        self.lookup_ms_total = 0.0
+        self.lookup_ms_max = 0.0
+
+    def on_user_transcript(self, phone_number: str, transcript: str):
+        """Schedule a refresh for a completed user transcript. Never blocks."""
+        if not phone_number or len(transcript.split()) < MIN_TRANSCRIPT_WORDS:
+            return
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = (phone_number, transcript)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        try:
+            while self._pending is not None:
+                wait = self._last_push + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                phone_number, transcript = self._pending
+                self._pending = None
+                memories = await self._lookup(phone_number, transcript)
+                new = [memory for memory in memories if memory not in self.injected][:self.max_memories]
+                if new:
+                    await self._push(new)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Error refreshing call context: {e}")
+
+    async def _lookup(self, phone_number: str, transcript: str):
+        key = " ".join(transcript.lower().split())
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        start = time.perf_counter()
+        memories = await asyncio.get_running_loop().run_in_executor(
+            None, self.lookup, phone_number, CONTEXT_LOOKUP_LIMIT, transcript)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.lookups += 1
+        self.lookup_ms_total += elapsed_ms
+        self.lookup_ms_max = max(self.lookup_ms_max, elapsed_ms)
+
+        self._cache[key] = memories
+        if len(self._cache) > LOOKUP_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return memories
+
+    async def _push(self, memories):
+        text = ("Related memories about the user, for context only. Use them naturally if relevant, "
+                "without mentioning that you remembered them:\n" + "\n".join(f"- {memory}" for memory in memories))
+        await self.openai_ws.send(conversation_item("system", text))
+        self.openai_ws.remember_item("system", text)
+        self.injected.update(memories)
+        self._last_push = time.monotonic()
+        self.pushes += 1
+        self.memories_pushed += len(memories)
+
+    def stats(self) -> dict:
+        return {
+            "lookups": self.lookups,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "pushes": self.pushes,
+            "memories_pushed": self.memories_pushed,
+            "lookup_ms_mean": self.lookup_ms_total / self.lookups if self.lookups else 0.0,
+            "lookup_ms_max": self.lookup_ms_max,
+        }
@@ -0,0 +1,210 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from memory_manager import get_mem0_stats
+
+# Event-loop health settings
+LOOP_CHECK_INTERVAL_MS = float(os.getenv("LOOP_CHECK_INTERVAL_MS", 50))
+SLOW_CALLBACK_THRESHOLD_MS = float(os.getenv("SLOW_CALLBACK_THRESHOLD_MS", 100))
+MAX_SLOW_CALLBACKS = 50  # Most recent blocking events kept for the diagnostics endpoint
+MAX_FINISHED_CALLS = 20
+ATTRIBUTION_FILE = "voice_handler.py"  # Frames from this file identify the responsible handler
+
+
+class CallCounters:
+    """Relay counters for a single media stream."""
+
+    __slots__ = ("stream_sid", "phone_number", "started_at", "ended_at",
+                 "twilio_messages", "twilio_bytes", "media_frames_in",
+                 "openai_messages", "openai_bytes", "audio_deltas_out", "audio_stats",
+                 "context_refresher", "usage")
+
+    def __init__(self, audio_stats=None):
+        self.stream_sid = None
+        self.phone_number = None
+        self.started_at = time.time()
+        self.ended_at = None
+        self.twilio_messages = 0
+        self.twilio_bytes = 0
+        self.media_frames_in = 0
+        self.openai_messages = 0
+        self.openai_bytes = 0
+        self.audio_deltas_out = 0
+        self.audio_stats = audio_stats
+        self.context_refresher = None
+        self.usage = None
+
+    def snapshot(self) -> dict:
+        data = {
+            "stream_sid": self.stream_sid,
+            "phone_number": self.phone_number,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "duration_s": (self.ended_at or time.time()) - self.started_at,
+            "twilio_messages": self.twilio_messages,
+            "twilio_bytes": self.twilio_bytes,
+            "media_frames_in": self.media_frames_in,
+            "openai_messages": self.openai_messages,
+            "openai_bytes": self.openai_bytes,
+            "audio_deltas_out": self.audio_deltas_out,
+        }
+        if self.audio_stats is not None:
+            data["audio"] = self.audio_stats.summary()
+        if self.context_refresher is not None:
+            data["context_refresh"] = self.context_refresher.stats()
+        if self.usage is not None:
+            data["usage"] = self.usage.snapshot()
+        return data
+
+
+active_calls = {}  # stream_sid -> CallCounters
+finished_calls = deque(maxlen=MAX_FINISHED_CALLS)
+
+
+def register_call(stream_sid: str, counters: CallCounters):
+    counters.stream_sid = stream_sid
+    active_calls[stream_sid] = counters
+
+
+def finish_call(counters: CallCounters):
+    counters.ended_at = time.time()
+    if active_calls.get(counters.stream_sid) is counters:
+        del active_calls[counters.stream_sid]
+    finished_calls.append(counters.snapshot())
+
+
+def _attribute(frame):
+    """
+    Walk a captured stack from the innermost frame outwards and return the
+    innermost voice_handler function plus the stream_sid it was serving.
+    """
+    function = None
+    stream_sid = None
+    while frame is not None:
+        if frame.f_code.co_filename.endswith(ATTRIBUTION_FILE):
+            if function is None:
+                function = frame.f_code.co_name
+            sid = frame.f_locals.get("stream_sid")
+            if stream_sid is None and isinstance(sid, str):
+                stream_sid = sid
+        frame = frame.f_back
+    return function, stream_sid
+
+
+class LoopMonitor:
+    """
+    Measures event-loop lag with a periodic heartbeat task and runs a watchdog
+    thread that captures the loop thread's stack whenever the heartbeat stalls
+    for longer than the slow-callback threshold.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_CHECK_INTERVAL_MS,
+                 threshold_ms: float = SLOW_CALLBACK_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.recent_lag = deque(maxlen=200)
+        self.slow_callbacks = deque(maxlen=MAX_SLOW_CALLBACKS)
+        self._heartbeat = time.monotonic()
+        self._captured_heartbeat = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._loop_thread_id = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._record_lag(lag, now)
+
+    def _record_lag(self, lag: float, now: float):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.recent_lag.append(lag)
+        with self._lock:
+            # Fill in how long the stall captured by the watchdog actually lasted
+            if self._captured_heartbeat == self._heartbeat and self.slow_callbacks:
+                self.slow_callbacks[-1]["blocked_ms"] = round(lag * 1000, 1)
+            self._heartbeat = now
+
+    def _watchdog(self):
+        while not self._stopping.wait(self.threshold / 2):
+            with self._lock:
+                heartbeat = self._heartbeat
+                stalled = time.monotonic() - heartbeat - self.interval
+                if stalled < self.threshold or self._captured_heartbeat == heartbeat:
+                    continue
+                self._captured_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            function, stream_sid = _attribute(frame)
+            event = {
+                "detected_at": time.time(),
+                "blocked_ms": round(stalled * 1000, 1),  # Lower bound, updated once the loop resumes
+                "function": function,
+                "stream_sid": stream_sid,
+                "stack": traceback.format_stack(frame),
+            }
+            del frame
+            with self._lock:
+                self.slow_callbacks.append(event)
+            print(f"Event loop blocked for >{event['blocked_ms']}ms in {function} (stream {stream_sid})")
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.recent_lag)
+        with self._lock:
+            slow_callbacks = list(self.slow_callbacks)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": self.samples,
+            "mean_lag_ms": self.total_lag / self.samples * 1000 if self.samples else 0.0,
+            "max_lag_ms": self.max_lag * 1000,
+            "p99_recent_lag_ms": recent[int(len(recent) * 0.99)] * 1000 if recent else 0.0,
+            "slow_callbacks": slow_callbacks,
+        }
+
+
+loop_monitor = LoopMonitor()
+
+
+async def get_diagnostics():
+    """Diagnostics endpoint: event-loop health, recent blocking callbacks, per-call and Mem0 call counters."""
+    return {
+        "event_loop": loop_monitor.snapshot(),
+        "mem0_calls": get_mem0_stats(),
+        "active_calls": [counters.snapshot() for counters in active_calls.values()],
+        "finished_calls": list(finished_calls),
+    }
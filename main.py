@@ -1,11 +1,24 @@
 from fastapi import FastAPI, Request
 from voice_handler import handle_media_stream, handle_incoming_call, make_call
+from diagnostics import loop_monitor, get_diagnostics
+from memory_manager import start_memory_shipper, stop_memory_shipper
+from call_accounting import get_stats
 import uvicorn
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def start_background_tasks():
+    loop_monitor.start()
+    start_memory_shipper()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await loop_monitor.stop()
+    stop_memory_shipper()
+
 # Define a root endpoint
 @app.get("/")
 async def read_root():
@@ -15,6 +28,8 @@ async def read_root():
 app.add_api_route("/incoming-call", handle_incoming_call, methods=["POST"])
 app.websocket("/media-stream")(handle_media_stream)
 app.add_api_route("/make-call", make_call, methods=["POST"])
+app.add_api_route("/diagnostics", get_diagnostics, methods=["GET"])
+app.add_api_route("/stats", get_stats, methods=["GET"])
 
 # Add these lines after creating the FastAPI app
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -0,0 +1,264 @@
+# Local per-user semantic index over Mem0 memories. Each user's memories are embedded
+# into a float32 matrix stored as .npy (memory-mapped on load) next to a JSON file of
+# ids and texts, so prompt building can pick the most relevant memories without a
+# remote round-trip. Mem0 stays the source of truth; indexes are rebuilt from get_all.
+#
+# Benchmark: python memory_index.py [--memories 100000]
+# Known limitation: a top-10 query over 100k memories takes about 0.75 ms median on one
+# core but ~1.2 ms at p99, since it still reads every row of the query's columns.
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MEMORY_INDEX_DIR = os.getenv("MEMORY_INDEX_DIR", "memory_index")
+MEMORY_INDEX_TTL = float(os.getenv("MEMORY_INDEX_TTL", 300))  # Seconds before an index is refreshed from Mem0
+EMBEDDING_DIM = 256
+
+TOKEN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its me my of on or our she "
+    "so that the their them they this to was we were what when with you your user user's".split()
+)
+
+
+class HashingEmbedder:
+    """
+    Offline embedder: sublinear term counts hashed into a fixed number of signed
+    buckets, L2-normalized so a dot product is the cosine similarity.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+
+    def embed(self, texts) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for token in TOKEN.findall(text.lower()):
+                if token not in STOPWORDS:
+                    counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                h = zlib.crc32(token.encode("utf-8"))
+                weight = 1.0 + np.log(count)
+                vectors[row, h % self.dim] += -weight if h & 0x80000000 else weight
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+EMBEDDERS = {HashingEmbedder.name: HashingEmbedder}
+
+
+def get_embedder(name: str = None):
+    return EMBEDDERS[name or os.getenv("MEMORY_EMBEDDER", HashingEmbedder.name)]()
+
+
+class UserMemoryIndex:
+    """Embedding matrix plus ids/texts for one user's memories, in Mem0 storage order."""
+
+    def __init__(self, ids, texts, embeddings: np.ndarray, embedder, built_at: float = None):
+        self.ids = ids
+        self.texts = texts
+        # Column-major, so scoring a sparse query only reads the columns it touches
+        self.embeddings = embeddings if embeddings.flags.f_contiguous else np.asfortranarray(embeddings)
+        self.embedder = embedder
+        self.built_at = built_at or time.time()
+
+    @classmethod
+    def build(cls, memories, embedder) -> "UserMemoryIndex":
+        """Build from Mem0 get_all() results."""
+        ids = [memory.get("id") for memory in memories]
+        texts = [memory["memory"] for memory in memories]
+        return cls(ids, texts, embedder.embed(texts), embedder)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query: str, k: int = 10):
+        """Return up to k memory texts most similar to the query, best first."""
+        if not self.texts or not query:
+            return []
+        query_vector = self.embedder.embed([query])[0]
+        nonzero = np.flatnonzero(query_vector)
+        if nonzero.size == 0:
+            return []
+        if nonzero.size * 4 < query_vector.size:
+            scores = self.embeddings[:, nonzero] @ query_vector[nonzero]
+        else:
+            scores = self.embeddings @ query_vector
+        best = scores.max()
+        if best <= 0:
+            return []
+        # If at least k memories score within half of the best, the top k are among
+        # them, so only that short list is partitioned instead of every score
+        candidates = np.flatnonzero(scores >= best * 0.5)
+        if candidates.size < k:
+            candidates = np.flatnonzero(scores > 0)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        top = candidates[np.argsort(scores[candidates])[::-1]]
+        return [self.texts[i] for i in top]
+
+    def recent(self, k: int = 10):
+        """Return the last k memories in storage order, like get_all()[-k:]."""
+        return self.texts[-k:]
+
+    def save(self, directory: str, key: str):
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, key)
+        # Write to temporary files unique to this writer and rename, so readers never
+        # see a partial index even if another process saves the same user at once
+        tmp = f"{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(f"{base}.npy.{tmp}", "wb") as f:
+            np.save(f, self.embeddings)
+        with open(f"{base}.json.{tmp}", "w", encoding="utf-8") as f:
+            json.dump({"embedder": self.embedder.name, "dim": self.embedder.dim,
+                       "built_at": self.built_at, "ids": self.ids, "texts": self.texts}, f)
+        os.replace(f"{base}.npy.{tmp}", f"{base}.npy")
+        os.replace(f"{base}.json.{tmp}", f"{base}.json")
+
+    @classmethod
+    def load(cls, directory: str, key: str, embedder):
+        """Load a saved index with the embedding matrix memory-mapped. Returns None if missing or stale."""
+        base = os.path.join(directory, key)
+        try:
+            with open(f"{base}.json", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["embedder"] != embedder.name or meta["dim"] != embedder.dim:
+                return None
+            embeddings = np.load(f"{base}.npy", mmap_mode="r")
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        if embeddings.shape[0] != len(meta["texts"]):
+            return None
+        return cls(meta["ids"], meta["texts"], embeddings, embedder, meta["built_at"])
+
+
+class MemoryIndexStore:
+    """
+    Per-user indexes kept in memory and on disk. `fetch(user_id)` returns the
+    user's memories from Mem0; it is called synchronously only when no index
+    exists yet, otherwise stale indexes are refreshed on a background thread.
+    Builds for the same user are serialized, so concurrent first lookups share
+    a single fetch.
+    """
+
+    def __init__(self, fetch, directory: str = MEMORY_INDEX_DIR, ttl: float = MEMORY_INDEX_TTL, embedder=None):
+        self.fetch = fetch
+        self.directory = directory
+        self.ttl = ttl
+        self.embedder = embedder or get_embedder()
+        self._indexes = {}
+        self._refreshing = set()
+        self._user_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        return re.sub(r"[^\w+-]", "_", str(user_id))
+
+    def _user_lock(self, user_id: str) -> threading.RLock:
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.RLock())
+
+    def get(self, user_id: str) -> UserMemoryIndex:
+        index = self._indexes.get(user_id)
+        if index is None:
+            with self._user_lock(user_id):
+                index = self._indexes.get(user_id)  # Loaded by a concurrent lookup while waiting
+                if index is None:
+                    index = UserMemoryIndex.load(self.directory, self._key(user_id), self.embedder)
+                    if index is None:
+                        return self.refresh(user_id)
+                    self._indexes[user_id] = index
+        if time.time() - index.built_at > self.ttl:
+            self._refresh_in_background(user_id)
+        return index
+
+    def refresh(self, user_id: str) -> UserMemoryIndex:
+        """Rebuild a user's index from Mem0 and persist it."""
+        with self._user_lock(user_id):
+            index = UserMemoryIndex.build(self.fetch(user_id), self.embedder)
+            index.save(self.directory, self._key(user_id))
+            self._indexes[user_id] = index
+            return index
+
+    def _refresh_in_background(self, user_id: str):
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+
+        def run():
+            try:
+                self.refresh(user_id)
+            except Exception as e:
+                print(f"Error refreshing memory index for {user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(user_id)
+
+        threading.Thread(target=run, name=f"memory-index-{user_id}", daemon=True).start()
+
+
+def benchmark(n: int = 100_000, queries: int = 1000):
+    """Index build time, query latency and footprint for one user with n memories."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    vocabulary = ("garden tomatoes knitting grandson granddaughter doctor appointment walk park church "
+                  "piano jazz baseball red sox cooking soup bread travel italy florida daughter son "
+                  "husband wife cat dog morning evening tea coffee medication knee back pain book "
+                  "crossword birthday anniversary retirement teacher nurse engineer farm lake fishing").split()
+    memories = [{"id": str(i), "memory": " ".join(rng.choice(vocabulary, size=rng.integers(4, 12)))}
+                for i in range(n)]
+    embedder = get_embedder()
+
+    start = time.perf_counter()
+    index = UserMemoryIndex.build(memories, embedder)
+    print(f"build {n} memories:   {time.perf_counter() - start:8.2f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        index.save(directory, "bench")
+        print(f"save:                 {time.perf_counter() - start:8.2f} s")
+        start = time.perf_counter()
+        loaded = UserMemoryIndex.load(directory, "bench", embedder)
+        print(f"load (mmap):          {(time.perf_counter() - start) * 1000:8.2f} ms")
+        matrix_mb = os.path.getsize(os.path.join(directory, "bench.npy")) / 1e6
+        meta_mb = os.path.getsize(os.path.join(directory, "bench.json")) / 1e6
+        print(f"footprint:            {matrix_mb:8.1f} MB matrix + {meta_mb:.1f} MB metadata "
+              f"({embedder.dim} x float32 per memory)")
+
+        for size in (1_000, 10_000, n):
+            subset = UserMemoryIndex(loaded.ids[:size], loaded.texts[:size], loaded.embeddings[:size], embedder)
+            subset.search("garden tomatoes")  # Page in the mapped matrix
+            timings = []
+            for i in range(queries):
+                query = memories[i % n]["memory"]
+                start = time.perf_counter()
+                subset.search(query, 10)
+                timings.append(time.perf_counter() - start)
+            timings.sort()
+            print(f"top-10 query, {size:>7} memories: median {timings[len(timings) // 2] * 1e6:8.1f} us, "
+                  f"p99 {timings[int(len(timings) * 0.99)] * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the local memory index")
+    parser.add_argument("--memories", type=int, default=100_000)
+    args = parser.parse_args()
+    benchmark(args.memories)
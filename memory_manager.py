@@ -1,65 +1,175 @@
-from mem0 import MemoryClient
 import os
+import threading
+from collections import Counter
 from dotenv import load_dotenv
+from memory_outbox import MemoryOutbox, OutboxShipper
+from memory_index import MemoryIndexStore
+from call_accounting import get_usage_store
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Mem0 client
 MEM0_API_KEY = os.getenv("MEM0_API_KEY")
-mem0_client = MemoryClient(api_key=MEM0_API_KEY)
 
-def add_memory(phone_number: str, role: str, content: str):
+# The Mem0 client is built on first use: importing mem0 is slow and
+# MemoryClient validates the API key over the network on construction.
+_mem0_client = None
+_mem0_client_lock = threading.Lock()
+
+# Mem0 API calls made by this process, by method, for the diagnostics endpoint
+_mem0_calls = Counter()
+_mem0_calls_lock = threading.Lock()
+
+
+def get_mem0_client():
     """
-    Add a message to a user's memory, with custom categories and custom prompt to 
-    guide Mem0 in extracting best call times or call preferences.
+    Return the shared Mem0 client, importing mem0 and constructing it on first use.
     """
+    global _mem0_client
+    if _mem0_client is None:
+        with _mem0_client_lock:
+            if _mem0_client is None:
+                from mem0 import MemoryClient
+                _mem0_client = MemoryClient(api_key=MEM0_API_KEY)
+    return _mem0_client
+
+
+def _count_mem0_call(method: str, messages: int = 0):
+    with _mem0_calls_lock:
+        _mem0_calls[method] += 1
+        if messages:
+            _mem0_calls[f"{method}_messages"] += messages
+
+
+def get_mem0_stats() -> dict:
+    """Return how many Mem0 API calls (including failed ones) this process has made."""
+    with _mem0_calls_lock:
+        return dict(_mem0_calls)
+
+
+# Categories and prompt guidance for Mem0 when extracting memories, including best call times
+CUSTOM_CATEGORIES = [
+    {"personal_details": "Information related to the user's identity or personal attributes, such as their name, age, place of residence, or occupation."},
+    {"family": "Details about the user's family members, relationships, family history, or events involving relatives."},
+    {"professional_details": "Information pertaining to the user's current or past professions, careers, work experiences, and achievements in their professional life."},
+    {"sports": "References to any sports the user follows, participates in, or discusses, including team names, matches, personal performance, or sports-related interests."},
+    {"travel": "Mentions of travel destinations, trips, vacations, favorite places visited, or future travel plans."},
+    {"food": "References to meals, dietary preferences, recipes, cooking habits, culinary experiences, and favorite dishes."},
+    {"music": "Mentions of musical preferences, favorite songs, artists, genres, concerts, or past musical experiences."},
+    {"health": "Information about the user's health conditions, medication, exercise habits, doctor visits, and general well-being."},
+    {"technology": "Any details related to technology usage, devices the user owns or uses, technical support needs, or discussions about modern tech."},
+    {"hobbies": "Information about the user's leisure activities, crafts, collections, games, gardening, or other pastimes they enjoy."},
+    {"fashion": "Mentions of clothing preferences, style, shopping experiences, or any fashion-related interests."},
+    {"entertainment": "Discussions about movies, TV shows, theater, books, radio programs, or other forms of entertainment."},
+    {"milestones": "Significant life events, anniversaries, birthdays, graduations, retirements, or other key personal milestones."},
+    {"user_preferences": "General personal likes, dislikes, comfort levels, routines, and preferences that don't fit into more specific categories."},
+    {"misc": "Any content or references that don't clearly match other defined categories."},
+
+    # Additional helpful categories
+    {"call_schedule": "Extract any mention of the best time for the user to receive calls, including preferred times or schedules."},
+    {"daily_routine": "Mentions of the user's regular daily activities, such as wake-up times, meal times, walk schedules, or evening rituals."},
+    {"emotional_state": "References to the user's feelings, mood, emotional well-being, loneliness, happiness, or frustration."},
+    {"memories": "Conversations involving reminiscing about the past, nostalgic stories, childhood memories, and life reflections."},
+    {"care_instructions": "Important instructions or reminders related to medication, therapy sessions, medical appointments, or personal care routines."}
+]
+
+
+_memory_outbox = None
+_memory_outbox_lock = threading.Lock()
+_memory_shipper = None
+
+
+def get_memory_outbox() -> MemoryOutbox:
+    """Return the shared durable outbox, opening it on first use."""
+    global _memory_outbox
+    if _memory_outbox is None:
+        with _memory_outbox_lock:
+            if _memory_outbox is None:
+                _memory_outbox = MemoryOutbox()
+    return _memory_outbox
+
+
+def start_memory_shipper():
+    """Start the background thread that ships outbox rows to Mem0."""
+    global _memory_shipper
+    if _memory_shipper is None:
+        _memory_shipper = OutboxShipper(get_memory_outbox(), ship_to_mem0)
+    _memory_shipper.start()
+
+
+def stop_memory_shipper():
+    if _memory_shipper is not None:
+        _memory_shipper.stop()
+
+
+def ship_to_mem0(phone_number: str, conversation: str, messages: list, idempotency_keys: list):
+    """
+    Send a batch of messages to a user's Mem0 memory, with custom categories to
+    guide Mem0 in extracting best call times or call preferences. Raises on failure
+    so the outbox can retry. Mem0 does not deduplicate, so the outbox row keys are
+    stored in the metadata to let retried messages be identified. The call is
+    accounted to the conversation (the call's stream_sid) it shipped turns for.
+    """
+    _count_mem0_call("add", len(messages))
+    get_mem0_client().add(
+        messages=messages,
+        user_id=phone_number,
+        custom_categories=CUSTOM_CATEGORIES,
+        metadata={"idempotency_keys": idempotency_keys},
+    )
+    if conversation:
+        try:
+            get_usage_store().record_mem0_calls(conversation)
+        except Exception as e:
+            # The memories were delivered; failing here would only ship them again
+            print(f"Error recording Mem0 usage for {conversation}: {e}")
+
+
+def add_memory(phone_number: str, role: str, content: str, conversation: str = None, created_at: float = None):
+    """
+    Add a message to a user's memory. The message is recorded in the durable
+    outbox first and shipped to Mem0 in the background, so a slow or failing
+    Mem0 never loses it or blocks the call. Pass the time the turn was written to
+    the transcription log, so a later backfill of that log recognizes it.
+    """
+    if not phone_number:
+        print(f"Skipping memory without a phone number: {content[:50]}")
+        return
     try:
-        # Prepare the payload for Mem0
-        messages = [{"role": role, "content": content}]
-        
-        custom_categories = [
-            {"personal_details": "Information related to the user's identity or personal attributes, such as their name, age, place of residence, or occupation."},
-            {"family": "Details about the user's family members, relationships, family history, or events involving relatives."},
-            {"professional_details": "Information pertaining to the user's current or past professions, careers, work experiences, and achievements in their professional life."},
-            {"sports": "References to any sports the user follows, participates in, or discusses, including team names, matches, personal performance, or sports-related interests."},
-            {"travel": "Mentions of travel destinations, trips, vacations, favorite places visited, or future travel plans."},
-            {"food": "References to meals, dietary preferences, recipes, cooking habits, culinary experiences, and favorite dishes."},
-            {"music": "Mentions of musical preferences, favorite songs, artists, genres, concerts, or past musical experiences."},
-            {"health": "Information about the user's health conditions, medication, exercise habits, doctor visits, and general well-being."},
-            {"technology": "Any details related to technology usage, devices the user owns or uses, technical support needs, or discussions about modern tech."},
-            {"hobbies": "Information about the user's leisure activities, crafts, collections, games, gardening, or other pastimes they enjoy."},
-            {"fashion": "Mentions of clothing preferences, style, shopping experiences, or any fashion-related interests."},
-            {"entertainment": "Discussions about movies, TV shows, theater, books, radio programs, or other forms of entertainment."},
-            {"milestones": "Significant life events, anniversaries, birthdays, graduations, retirements, or other key personal milestones."},
-            {"user_preferences": "General personal likes, dislikes, comfort levels, routines, and preferences that don't fit into more specific categories."},
-            {"misc": "Any content or references that don't clearly match other defined categories."},
-
-            # Additional helpful categories
-            {"call_schedule": "Extract any mention of the best time for the user to receive calls, including preferred times or schedules."},
-            {"daily_routine": "Mentions of the user's regular daily activities, such as wake-up times, meal times, walk schedules, or evening rituals."},
-            {"emotional_state": "References to the user's feelings, mood, emotional well-being, loneliness, happiness, or frustration."},
-            {"memories": "Conversations involving reminiscing about the past, nostalgic stories, childhood memories, and life reflections."},
-            {"care_instructions": "Important instructions or reminders related to medication, therapy sessions, medical appointments, or personal care routines."}
-        ]
-
-        response = mem0_client.add(
-            messages=messages,
-            user_id=phone_number,
-            custom_categories=custom_categories,
-        )
-        
+        get_memory_outbox().enqueue(phone_number, role, content, conversation=conversation, created_at=created_at)
     except Exception as e:
         print(f"Error adding memory for {phone_number}: {e}")
 
 
-def get_memory_context(phone_number, limit=10):
+_memory_index_store = None
+_memory_index_store_lock = threading.Lock()
+
+
+def _fetch_memories(user_id: str) -> list:
+    _count_mem0_call("get_all")
+    return get_mem0_client().get_all(user_id=user_id)
+
+
+def get_memory_index_store() -> MemoryIndexStore:
+    """Return the local memory index, which is rebuilt from Mem0 get_all() when stale."""
+    global _memory_index_store
+    if _memory_index_store is None:
+        with _memory_index_store_lock:
+            if _memory_index_store is None:
+                _memory_index_store = MemoryIndexStore(fetch=_fetch_memories)
+    return _memory_index_store
+
+
+def get_memory_context(phone_number, limit=10, query=None):
     """
-    Retrieve the recent chat context for a user.
+    Retrieve chat context for a user from the local memory index. With a query,
+    returns the most relevant memories; otherwise the most recent ones.
     """
     try:
-        memories = mem0_client.get_all(user_id=phone_number)
-        return [memory["memory"] for memory in memories[-limit:]]
+        index = get_memory_index_store().get(phone_number)
+        if query:
+            return index.search(query, limit)
+        return index.recent(limit)
     except Exception as e:
         print(f"Error retrieving context for {phone_number}: {e}")
         return []
@@ -69,7 +179,7 @@ def get_call_schedule(phone_number, limit=10):
     Retrieve the recent chat context for a user.
     """
     try:
-        memories = mem0_client.get_all(user_id=phone_number)
+        memories = _fetch_memories(phone_number)
         return [memory["call_schedule"] for memory in memories[-limit:]]
     except Exception as e:
         print(f"Error retrieving context for {phone_number}: {e}")
@@ -80,10 +190,11 @@ def clear_memory(phone_number):
     Clear the chat history for a user by deleting each memory individually.
     """
     try:
-        memories = mem0_client.get_all(user_id=phone_number)
+        memories = _fetch_memories(phone_number)
         for memory in memories:
             memory_id = memory["id"]
-            mem0_client.delete(memory_id=memory_id)  # Delete each memory
+            _count_mem0_call("delete")
+            get_mem0_client().delete(memory_id=memory_id)  # Delete each memory
         print(f"Memory cleared for {phone_number}")
     except Exception as e:
         print(f"Error clearing memory for {phone_number}: {e}")
@@ -0,0 +1,320 @@
+# Durable outbox for memory writes. Every transcript turn is recorded in a local SQLite
+# table before it is shipped to Mem0, so nothing is lost when Mem0 is slow or down and
+# the full history can be re-ingested later. Rows are claimed with a lease before they
+# are shipped, so the server's shipper and the drain/backfill commands can run side by
+# side without sending the same rows. Delivery to Mem0 is still at-least-once: a batch
+# whose add() succeeded but whose outcome was not recorded before the lease ran out is
+# sent again, and Mem0 does not deduplicate, so every message carries its row's
+# idempotency key in the metadata.
+#
+# Usage:
+#   python memory_outbox.py status
+#   python memory_outbox.py drain
+#   python memory_outbox.py backfill [--dir transcription_logs] [--workers 8]
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+MEMORY_OUTBOX_PATH = os.getenv("MEMORY_OUTBOX_PATH", "memory_outbox.db")
+SHIP_BATCH_SIZE = 50  # Rows claimed per shipper pass
+CLAIM_LEASE = 120  # Seconds claimed rows are reserved for the process shipping them
+MAX_MESSAGES_PER_ADD = 20  # Messages sent to Mem0 in one add() call
+SHIP_POLL_INTERVAL = 1.0  # Seconds the shipper sleeps when the outbox is empty
+MAX_RETRY_DELAY = 300  # Seconds, cap for the exponential retry backoff
+
+LOG_FILENAME = re.compile(r"^(?P<phone>.+?)_(?P<date>\d{4}-\d{2}-\d{2})_(?P<sid>[^_]+)\.txt$")
+LOG_TURN = re.compile(r"^\[(?P<time>\d{2}:\d{2}:\d{2})\] (?P<speaker>User|Assistant): ?(?P<text>.*)$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    conversation TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    shipped_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (shipped_at, next_attempt_at);
+"""
+
+
+def make_idempotency_key(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def turn_key(user_id: str, conversation: str, role: str, content: str, created_at: float) -> str:
+    """
+    Idempotency key for a transcript turn, shared by live writes and log backfills.
+    Uses the local wall-clock second the turn was logged at and whitespace-normalized
+    content, which is all a transcription log line preserves.
+    """
+    second = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
+    return make_idempotency_key(user_id, conversation, role, " ".join(content.split()), second)
+
+
+class MemoryOutbox:
+    """SQLite-backed outbox with one connection per thread."""
+
+    def __init__(self, path: str = MEMORY_OUTBOX_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.wakeup = threading.Event()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, user_id: str, role: str, content: str, conversation: str = None,
+                idempotency_key: str = None, created_at: float = None) -> bool:
+        """Record a turn. Returns False if a row with the same idempotency key already exists."""
+        created_at = created_at or time.time()
+        key = idempotency_key or turn_key(user_id, conversation, role, content, created_at)
+        cursor = self._connection().execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, user_id, conversation, role, content, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, user_id, conversation, role, content, created_at),
+        )
+        self.wakeup.set()
+        return cursor.rowcount == 1
+
+    def enqueue_many(self, rows) -> int:
+        """Bulk insert (key, user_id, conversation, role, content, created_at) tuples in one transaction."""
+        conn = self._connection()
+        before = conn.total_changes
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (idempotency_key, user_id, conversation, role, content, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self.wakeup.set()
+        return conn.total_changes - before
+
+    def claim(self, limit: int = None, lease: float = CLAIM_LEASE):
+        """
+        Claim unshipped rows whose retry time has come, oldest first, by pushing their
+        retry time past the lease in a single statement. Other processes skip claimed
+        rows until they are marked shipped or failed, or the lease expires.
+        """
+        now = time.time()
+        rows = self._connection().execute(
+            "UPDATE outbox SET next_attempt_at = ? WHERE id IN ("
+            "SELECT id FROM outbox WHERE shipped_at IS NULL AND next_attempt_at <= ? ORDER BY id LIMIT ?"
+            ") RETURNING id, idempotency_key, user_id, conversation, role, content",
+            (now + lease, now, limit or -1),
+        ).fetchall()
+        return sorted(rows)
+
+    def mark_shipped(self, ids):
+        self._connection().executemany(
+            "UPDATE outbox SET shipped_at = ?, last_error = NULL WHERE id = ?",
+            [(time.time(), row_id) for row_id in ids],
+        )
+
+    def mark_failed(self, ids, error: str):
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE outbox SET attempts = attempts + 1, last_error = ?, "
+            "next_attempt_at = ? + MIN(?, 1 << MIN(attempts, 16)) WHERE id = ?",
+            [(error, now, MAX_RETRY_DELAY, row_id) for row_id in ids],
+        )
+
+    def status(self) -> dict:
+        pending, failing, shipped = self._connection().execute(
+            "SELECT SUM(shipped_at IS NULL), SUM(shipped_at IS NULL AND attempts > 0), SUM(shipped_at IS NOT NULL) "
+            "FROM outbox"
+        ).fetchone()
+        return {"pending": pending or 0, "retrying": failing or 0, "shipped": shipped or 0}
+
+
+def group_batches(rows):
+    """Group outbox rows into per-user, per-conversation batches of at most MAX_MESSAGES_PER_ADD."""
+    groups = {}
+    for row in rows:
+        groups.setdefault((row[2], row[3]), []).append(row)
+    batches = []
+    for group in groups.values():
+        for start in range(0, len(group), MAX_MESSAGES_PER_ADD):
+            batches.append(group[start:start + MAX_MESSAGES_PER_ADD])
+    return batches
+
+
+def ship_batch(outbox: MemoryOutbox, batch, ship) -> bool:
+    """
+    Send one batch through `ship(user_id, conversation, messages, idempotency_keys)` and
+    record the outcome. Batches are regrouped on every pass, so a retry may not contain the same
+    rows; the per-row keys are passed along instead of a key for the batch as a whole.
+    """
+    ids = [row[0] for row in batch]
+    user_id, conversation = batch[0][2], batch[0][3]
+    messages = [{"role": row[4], "content": row[5]} for row in batch]
+    keys = [row[1] for row in batch]
+    try:
+        ship(user_id, conversation, messages, keys)
+    except Exception as e:
+        print(f"Error shipping {len(batch)} memories for {user_id}: {e}")
+        outbox.mark_failed(ids, str(e))
+        return False
+    outbox.mark_shipped(ids)
+    return True
+
+
+def drain(outbox: MemoryOutbox, ship, workers: int = 1, limit: int = None) -> tuple:
+    """Claim and ship due rows, with at most `workers` Mem0 calls in flight. Returns (shipped, failed) batches."""
+    batches = group_batches(outbox.claim(limit))
+    shipped = failed = 0
+    if workers <= 1:
+        for batch in batches:
+            if ship_batch(outbox, batch, ship):
+                shipped += 1
+            else:
+                failed += 1
+        return shipped, failed
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(ship_batch, outbox, batch, ship) for batch in batches]
+        for future in as_completed(futures):
+            if future.result():
+                shipped += 1
+            else:
+                failed += 1
+    return shipped, failed
+
+
+def drain_all(outbox: MemoryOutbox, ship, workers: int = 1) -> tuple:
+    """
+    Drain until no rows are due, claiming a few batches per worker at a time so each
+    claim is shipped well within its lease. Failed rows wait for their retry time.
+    """
+    shipped = failed = 0
+    while True:
+        done, errors = drain(outbox, ship, workers=workers, limit=SHIP_BATCH_SIZE * max(1, workers))
+        if not done and not errors:
+            return shipped, failed
+        shipped += done
+        failed += errors
+
+
+class OutboxShipper:
+    """Background thread that drains the outbox into Mem0 in batches."""
+
+    def __init__(self, outbox: MemoryOutbox, ship):
+        self.outbox = outbox
+        self.ship = ship
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-outbox-shipper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stopping.set()
+        self.outbox.wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self.outbox.wakeup.clear()
+            try:
+                shipped, failed = drain(self.outbox, self.ship, limit=SHIP_BATCH_SIZE)
+            except Exception as e:
+                print(f"Error draining memory outbox: {e}")
+                shipped = failed = 0
+            if shipped == 0 or failed:
+                # Nothing left or Mem0 is failing; wait for new rows or the next retry window
+                self.outbox.wakeup.wait(SHIP_POLL_INTERVAL)
+
+
+def parse_transcription_log(path: Path):
+    """
+    Yield (idempotency_key, user_id, conversation, role, content, created_at) rows for
+    each turn in a transcription_logs/ file. Keys match the ones live calls enqueue
+    with, so neither re-running a backfill nor backfilling turns that were already
+    recorded live duplicates rows.
+    """
+    match = LOG_FILENAME.match(path.name)
+    if not match or match["phone"] == "None":
+        return
+    user_id, date, conversation = match["phone"], match["date"], match["sid"]
+
+    turns = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip("\n")
+            turn = LOG_TURN.match(line)
+            if turn:
+                turns.append([turn["time"], turn["speaker"].lower(), turn["text"].strip()])
+            elif turns and line.strip() and not line.startswith("=") and "===" not in line:
+                turns[-1][2] = f"{turns[-1][2]}\n{line.strip()}".strip()  # Transcript spanning lines
+
+    for clock, role, text in turns:
+        if not text:
+            continue
+        created_at = time.mktime(time.strptime(f"{date} {clock}", "%Y-%m-%d %H:%M:%S"))
+        yield turn_key(user_id, conversation, role, text, created_at), user_id, conversation, role, text, created_at
+
+
+def backfill(outbox: MemoryOutbox, log_dir: str, ship, workers: int = 8):
+    """Load every transcription log into the outbox and ship it with bounded parallelism."""
+    start = time.perf_counter()
+    rows = []
+    files = sorted(Path(log_dir).glob("*.txt"))
+    for path in files:
+        rows.extend(parse_transcription_log(path))
+    added = outbox.enqueue_many(rows)
+    print(f"Parsed {len(rows)} turns from {len(files)} files, {added} new")
+
+    shipped, failed = drain_all(outbox, ship, workers=workers)
+    print(f"Shipped {shipped} batches, {failed} failed (will be retried) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+def main():
+    # Imported here so memory_manager can import this module for the outbox itself
+    from memory_manager import ship_to_mem0
+
+    parser = argparse.ArgumentParser(description="Inspect, drain or backfill the Mem0 memory outbox")
+    parser.add_argument("command", choices=["status", "drain", "backfill"])
+    parser.add_argument("--dir", default="transcription_logs", help="Transcription log directory for backfill")
+    parser.add_argument("--workers", type=int, default=8, help="Maximum concurrent Mem0 requests")
+    args = parser.parse_args()
+
+    outbox = MemoryOutbox()
+    if args.command == "backfill":
+        backfill(outbox, args.dir, ship_to_mem0, workers=args.workers)
+    elif args.command == "drain":
+        shipped, failed = drain_all(outbox, ship_to_mem0, workers=args.workers)
+        print(f"Shipped {shipped} batches, {failed} failed")
+    print(outbox.status())
+
+
+if __name__ == "__main__":
+    main()
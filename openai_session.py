@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+import websockets
+from websockets.exceptions import ConnectionClosed, ConnectionClosedError
+
+OPENAI_REALTIME_URL = 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01'
+
+# Reconnect settings
+AUDIO_BUFFER_MS = int(os.getenv("OPENAI_AUDIO_BUFFER_MS", 10000))  # Caller audio kept while the upstream is down
+FRAME_MS = 20  # Twilio sends one 20 ms frame per media message
+MAX_REPLAY_ITEMS = 20  # Recent conversation turns replayed into a new session
+RECONNECT_BACKOFF = [0, 0.2, 0.5, 1, 2, 4]  # Seconds before each reconnect attempt
+MAX_RECONNECTS = int(os.getenv("OPENAI_MAX_RECONNECTS", 10))  # Recovered drops allowed per call
+
+
+def conversation_item(role: str, text: str) -> str:
+    content_type = "text" if role == "assistant" else "input_text"
+    return json.dumps({
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": role,
+            "content": [{"type": content_type, "text": text}],
+        },
+    })
+
+
+class ResilientOpenAISession:
+    """
+    Realtime API connection that survives upstream drops.
+
+    Used like the websockets connection it wraps (send, async iteration, open,
+    close). When the socket drops, caller audio is kept in a bounded ring buffer,
+    the connection is re-established with backoff, and the last session.update
+    plus the recent conversation turns are replayed before the buffered audio,
+    so the conversation carries on where it left off.
+
+    Only abnormal closes are treated as drops. A clean close from the server
+    (e.g. the session hit its maximum duration) ends the session, as does
+    running out of reconnects for the call.
+    """
+
+    def __init__(self, url: str = OPENAI_REALTIME_URL, headers: dict = None,
+                 audio_buffer_ms: int = AUDIO_BUFFER_MS, backoff=RECONNECT_BACKOFF,
+                 max_reconnects: int = MAX_RECONNECTS):
+        self.url = url
+        self.headers = headers or {}
+        self.backoff = backoff
+        self.max_reconnects = max_reconnects
+        self.audio_buffer = deque(maxlen=max(1, audio_buffer_ms // FRAME_MS))
+        self.recent_items = deque(maxlen=MAX_REPLAY_ITEMS)
+        self.session_update = None
+        self.reconnects = []  # Downtime in ms of each recovered drop
+        self.dropped_frames = 0  # Frames that fell out of the full ring buffer
+        self._ws = None
+        self._closed = False
+        self._down_since = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        self._ws = await websockets.connect(self.url, extra_headers=self.headers)
+
+    @property
+    def open(self) -> bool:
+        """True until the session is closed or reconnecting has been given up."""
+        return not self._closed
+
+    async def close(self):
+        self._closed = True
+        if self._ws is not None:
+            await self._ws.close()
+
+    async def update_session(self, session_update: str):
+        """Send a session.update and remember it for replay after a reconnect."""
+        self.session_update = session_update
+        await self.send(session_update)
+
+    def remember_item(self, role: str, text: str):
+        """Record a completed conversation turn for replay after a reconnect."""
+        self.recent_items.append(conversation_item(role, text))
+
+    async def send(self, message: str) -> bool:
+        """Send a message if connected. Returns False if it could not be delivered."""
+        if self._ws is None or self._down_since is not None:
+            return False
+        try:
+            await self._ws.send(message)
+            return True
+        except ConnectionClosed:
+            self._mark_down()
+            return False
+
+    async def send_audio(self, payload: str):
+        """Append caller audio, buffering it while the upstream connection is down."""
+        if self._closed:
+            return
+        if self._down_since is None:
+            if await self.send(json.dumps({"type": "input_audio_buffer.append", "audio": payload})):
+                return
+        if len(self.audio_buffer) == self.audio_buffer.maxlen:
+            self.dropped_frames += 1
+        self.audio_buffer.append(payload)
+
+    def _mark_down(self):
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+            print("OpenAI connection dropped, buffering caller audio")
+
+    async def __aiter__(self):
+        while not self._closed:
+            try:
+                async for message in self._ws:
+                    yield message
+            except ConnectionClosedError:
+                pass
+            else:
+                # The iterator only ends normally on a clean close (code 1000/1001)
+                if not self._closed:
+                    print(f"OpenAI closed the session (code {self._ws.close_code}), not reconnecting")
+                    self._closed = True
+                return
+            if self._closed:
+                return
+            self._mark_down()
+            if len(self.reconnects) >= self.max_reconnects:
+                print(f"Giving up on OpenAI session after {len(self.reconnects)} reconnects this call")
+                self._closed = True
+                return
+            if not await self._reconnect():
+                self._closed = True
+                return
+
+    async def _reconnect(self) -> bool:
+        for attempt, delay in enumerate(self.backoff, start=1):
+            await asyncio.sleep(delay)
+            if self._closed:
+                return False
+            ws = None
+            try:
+                ws = await websockets.connect(self.url, extra_headers=self.headers)
+                if not self._closed:
+                    await self._replay(ws)
+            except (OSError, ConnectionClosed, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+                print(f"OpenAI reconnect attempt {attempt} failed: {e}")
+                if ws is not None:
+                    await ws.close()
+                continue
+            if self._closed:
+                # The call ended during the handshake or replay; don't leave a billable session open
+                await ws.close()
+                return False
+
+            self._ws = ws
+            downtime_ms = (time.monotonic() - self._down_since) * 1000
+            self._down_since = None
+            self.reconnects.append(downtime_ms)
+            print(f"OpenAI session restored after {downtime_ms:.0f}ms (attempt {attempt})")
+            return True
+
+        print(f"Giving up on OpenAI session after {len(self.backoff)} reconnect attempts")
+        return False
+
+    async def _replay(self, ws):
+        """Restore session settings, recent turns and buffered audio on a fresh connection."""
+        if self.session_update:
+            await ws.send(self.session_update)
+        for item in list(self.recent_items):
+            await ws.send(item)
+        while self.audio_buffer:
+            # Pop only after the send succeeds so a failed attempt keeps the audio
+            await ws.send(json.dumps({"type": "input_audio_buffer.append", "audio": self.audio_buffer[0]}))
+            self.audio_buffer.popleft()
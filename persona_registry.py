@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Personas and the Twilio numbers they answer are configured in a JSON file that is
+# re-read whenever it changes, so new personas/numbers do not need a restart.
+PERSONAS_FILE = os.getenv("PERSONAS_FILE", "personas.json")
+PERSONAS_RELOAD_INTERVAL = float(os.getenv("PERSONAS_RELOAD_INTERVAL", 5))  # Seconds between file checks
+
+MEMORY_PLACEHOLDER = "{user_memory}"
+_SPLICE_MARKER = "__USER_MEMORY_SPLICE__"
+
+DEFAULT_PERSONA_NAME = "joy"
+# Persona-specific texts that may not fall back to Joy's once base_message is overridden
+PROMPT_FIELDS = ("first_time_message", "returning_user_message")
+DEFAULT_PERSONA = {
+    "voice": "sage",  # OpenAI voice model
+    "temperature": 0.8,
+    "base_message": '''
+You are JOY, an empathetic, witty AI companion by MyOldFriend. Your goal is to provide meaningful, engaging companionship to elderly users, blending empathy with humor and charm. Think of yourself as a warm, attentive friend who can light up a conversation with a dash of humor and quick wit.
+
+General Behavior:
+Keep it Snappy: Stick to short, playful responses (1-2 sentences). Let the user do most of the talking.
+Humorous Warmth: Infuse light humor or charming remarks when appropriate, but remain respectful and kind.
+Empathy with Spark: Show you care deeply, but keep it lively and engaging.
+Natural Curiosity: Ask simple, fun follow-ups to encourage sharing: "What’s the secret to your green thumb?"
+Adapt to the Vibe: Match the user’s tone—joyful, reflective, or somewhere in between.
+
+Memory Handling:
+When memory is unavailable: Glide over gaps gracefully and humorously:
+"That sounds amazing—remind me how it all started?"
+"I could swear we talked about this, but refresh my memory—it’s worth hearing twice!"
+When memory is available: Drop in subtle callbacks to past conversations:
+"Still conquering the garden? What’s the latest adventure?"
+
+Interaction Style and Key Behaviors:
+Brevity is Beautiful: Prioritize sharp, engaging replies: "That’s awesome—tell me more!"
+Humorous Curiosity: Sprinkle in wit: "So, are we talking tomatoes or a jungle of cucumbers?"
+Positive Punch: Celebrate achievements with flair: "Impressive! Did you get a trophy for that?"
+Emotion Matching with Style: Match emotions but keep it light:
+Joyful user: "That’s fantastic—are you throwing a party yet?"
+Reflective user: "Sounds like a beautiful memory. Got more to share?"
+Fluid Memory Play: Weave past conversations smoothly:
+"Last time, you mentioned knitting—how’s that masterpiece coming along?"
+Constraints:
+
+Avoid discussing technical limitations or AI features.
+Skip overly formal or robotic phrasing.
+Stick to concise responses unless elaboration is clearly needed.
+        ''',
+    "first_time_message": '''
+            This time, you’re interacting with a first-time user, adapting the conversation to make them feel welcome and engaged. Use flexible, friendly introductions to create a warm first impression:
+            First-Time Interaction Introductions examples:
+            "Hi! I’m Joy, your new friend from MyOldFriend. I’m here to listen, chat, and share laughs. What’s something you’ve been thinking about lately?"
+            "Hello there! I’m Joy, so happy to meet you. Let’s chat about your favorite things or just keep each other company—what’s on your mind?"
+            "Hi, I’m Joy! Someone special thought we’d make a great pair. Let’s start with something light—how has your day been so far?"
+            "Hello! I’m Joy, your caring companion from MyOldFriend. I’d love to hear your favorite story or memory—what should we talk about first?"
+            "Hi, I’m Joy, and I’m here for you anytime you need me. What’s one thing that’s made you smile today?"
+        ''',
+    # {user_memory} is replaced with the caller's memories at call time
+    "returning_user_message": '''
+                    This time, you’re interacting with a return user, incorporating known information to create a sense of continuity and deepen the connection. Below is the memory you have for the user: 
+                    {user_memory}
+                    They are not a lot, but you should flexibly use them in conversation. Reference past interactions naturally, but don't explicitly mention that you're using memory.
+                ''',
+    "first_time_greeting": "Cheerfully greet the user with enthusiasm, introduce yourself, and let them know that you will always be their loyal companion. Happily ask the user how they are doing today.",
+    "returning_greeting": "Warmly greet the user as a returning friend, express joy at speaking with them again, and ask how they've been since your last conversation.",
+}
+
+
+def _message_item(text: str) -> str:
+    return json.dumps({
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": "user",
+            "content": [{"type": "input_text", "text": text}],
+        },
+    })
+
+
+class Persona:
+    """
+    A voice/prompt configuration with its session.update and greeting messages
+    serialized once. Only the caller's memory section is spliced in per call.
+    """
+
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.voice = config["voice"]
+        self.temperature = config["temperature"]
+        self.base_message = config["base_message"]
+
+        self.first_time_session_update = self._serialize(
+            self.base_message + f"\n\n{config['first_time_message']}")
+        self.no_memory_session_update = self._serialize(self.base_message)
+
+        # Serialize the returning-user template with a marker where the memory goes,
+        # then split so a call only needs to JSON-escape its own memory section.
+        before, _, after = config["returning_user_message"].partition(MEMORY_PLACEHOLDER)
+        template = self._serialize(self.base_message + f"\n\n{before}{_SPLICE_MARKER}{after}")
+        self._memory_prefix, self._memory_suffix = template.split(_SPLICE_MARKER)
+
+        self.first_time_greeting = _message_item(config["first_time_greeting"])
+        self.returning_greeting = _message_item(config["returning_greeting"])
+
+    def _serialize(self, instructions: str) -> str:
+        return json.dumps({
+            "type": "session.update",
+            "session": {
+                "turn_detection": {"type": "server_vad"},
+                "input_audio_format": "g711_ulaw",
+                "output_audio_format": "g711_ulaw",
+                "voice": self.voice,
+                "instructions": instructions,
+                "modalities": ["text", "audio"],
+                "input_audio_transcription": {"model": "whisper-1"},  # Enable user audio transcription
+                "temperature": self.temperature,
+            },
+        })
+
+    def session_update(self, is_returning_user: bool, user_memory=None) -> str:
+        """Return the serialized session.update message for a call."""
+        if not is_returning_user:
+            return self.first_time_session_update
+        if not user_memory:
+            return self.no_memory_session_update
+        return self._memory_prefix + json.dumps(str(user_memory))[1:-1] + self._memory_suffix
+
+    def greeting(self, is_returning_user: bool) -> str:
+        """Return the serialized conversation.item.create that prompts the opening greeting."""
+        return self.returning_greeting if is_returning_user else self.first_time_greeting
+
+
+class PersonaRegistry:
+    """
+    Personas keyed by the dialed Twilio number, loaded from PERSONAS_FILE:
+
+        {
+            "default": "joy",
+            "personas": {"max": {"voice": "ash", "base_message": "..."}},
+            "numbers": {"+15551234567": "max"}
+        }
+
+    Persona fields that are left out fall back to the built-in Joy persona, except
+    that a persona with its own base_message must also define first_time_message
+    and returning_user_message, since Joy's introduce her by name. The file is
+    checked for changes at most every PERSONAS_RELOAD_INTERVAL seconds.
+    """
+
+    def __init__(self, path: str = PERSONAS_FILE, reload_interval: float = PERSONAS_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._load({})
+
+    def _load(self, config: dict):
+        personas = {DEFAULT_PERSONA_NAME: Persona(DEFAULT_PERSONA_NAME, DEFAULT_PERSONA)}
+        for name, overrides in config.get("personas", {}).items():
+            missing = [field for field in PROMPT_FIELDS if field not in overrides]
+            if "base_message" in overrides and missing:
+                raise ValueError(f"Persona {name} overrides base_message but not {', '.join(missing)}")
+            personas[name] = Persona(name, {**DEFAULT_PERSONA, **overrides})
+
+        default_name = config.get("default", DEFAULT_PERSONA_NAME)
+        numbers = {}
+        for number, name in config.get("numbers", {}).items():
+            if name in personas:
+                numbers[number] = personas[name]
+            else:
+                print(f"Unknown persona {name} for {number}, using {default_name}")
+
+        self.personas = personas
+        self.numbers = numbers
+        self.default = personas.get(default_name, personas[DEFAULT_PERSONA_NAME])
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            try:
+                config = {}
+                if mtime is not None:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        config = json.load(f)
+                self._load(config)
+                self._mtime = mtime
+                print(f"Loaded {len(self.personas)} personas and {len(self.numbers)} numbers from {self.path}")
+            except Exception as e:
+                # Keep serving the previous configuration until the file is fixed
+                print(f"Error loading personas from {self.path}: {e}")
+
+    def get(self, dialed_number: str = None) -> Persona:
+        """Return the persona answering the given Twilio number, or the default persona."""
+        self._maybe_reload()
+        return self.numbers.get(dialed_number, self.default)
+
+
+persona_registry = PersonaRegistry()
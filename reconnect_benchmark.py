@@ -0,0 +1,93 @@
+# Measures how quickly ResilientOpenAISession recovers from dropped upstream connections.
+# A fake Realtime server kills each connection after a random delay while a simulated
+# caller streams 20 ms audio frames; the report shows recovery time and lost audio.
+# Usage: python reconnect_benchmark.py [--seconds 20] [--max-lifetime 2.0]
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import random
+import statistics
+import time
+import websockets
+from openai_session import ResilientOpenAISession, FRAME_MS
+
+
+class FakeRealtimeServer:
+    """Accepts connections, records what it receives and drops each connection at random."""
+
+    def __init__(self, min_lifetime: float, max_lifetime: float):
+        self.min_lifetime = min_lifetime
+        self.max_lifetime = max_lifetime
+        self.connections = 0
+        self.audio_frames = set()
+        self.replay_ok = True  # Every reconnect started with session.update
+
+    async def handler(self, ws):
+        self.connections += 1
+        reconnect = self.connections > 1
+        lifetime = random.uniform(self.min_lifetime, self.max_lifetime)
+        try:
+            first = json.loads(await ws.recv())
+            if reconnect and first["type"] != "session.update":
+                self.replay_ok = False
+            deadline = time.monotonic() + lifetime
+            while time.monotonic() < deadline:
+                try:
+                    message = json.loads(await asyncio.wait_for(ws.recv(), deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    break
+                if message["type"] == "input_audio_buffer.append":
+                    self.audio_frames.add(base64.b64decode(message["audio"]))
+                    await ws.send(json.dumps({"type": "response.audio.delta", "delta": message["audio"]}))
+        except websockets.ConnectionClosed:
+            return
+        # Simulate an abrupt upstream failure rather than a clean close
+        ws.transport.abort()
+
+
+async def run(seconds: float, min_lifetime: float, max_lifetime: float):
+    server = FakeRealtimeServer(min_lifetime, max_lifetime)
+    async with websockets.serve(server.handler, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        # Lift the per-call reconnect cap so every drop is measured
+        session = ResilientOpenAISession(url=f"ws://127.0.0.1:{port}", max_reconnects=int(seconds / min_lifetime) + 1)
+        await session.connect()
+        await session.update_session(json.dumps({"type": "session.update", "session": {}}))
+        session.remember_item("user", "Hello there")
+        session.remember_item("assistant", "Hi! How are you today?")
+
+        async def receive():
+            async for _ in session:
+                pass
+
+        receiver = asyncio.create_task(receive())
+        frames = int(seconds * 1000 / FRAME_MS)
+        for i in range(frames):
+            await session.send_audio(base64.b64encode(i.to_bytes(4, "big")).decode())
+            await asyncio.sleep(FRAME_MS / 1000)
+
+        await asyncio.sleep(1)  # Let the final reconnect drain the buffer
+        await session.close()
+        receiver.cancel()
+
+    delivered = len(server.audio_frames)
+    print(f"connections: {server.connections}, recovered drops: {len(session.reconnects)}")
+    if session.reconnects:
+        print(f"recovery time ms: median {statistics.median(session.reconnects):.1f}, "
+              f"max {max(session.reconnects):.1f}")
+    print(f"audio frames delivered: {delivered}/{frames} ({frames - delivered} lost, "
+          f"{session.dropped_frames} overflowed the ring buffer)")
+    print(f"session.update replayed first on every reconnect: {server.replay_ok}")
+
+
+if __name__ == "__main__":
+    logging.getLogger("websockets").setLevel(logging.CRITICAL)  # The fake server's aborts are expected
+    parser = argparse.ArgumentParser(description="Measure OpenAI session recovery time against a flaky fake server")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--min-lifetime", type=float, default=0.5)
+    parser.add_argument("--max-lifetime", type=float, default=2.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.seconds, args.min_lifetime, args.max_lifetime))
@@ -0,0 +1,84 @@
+# Measures how long it takes to import main:app (time-to-ready for uvicorn) using `python -X importtime`.
+# Usage: python startup_benchmark.py [--runs 5] [--top 15] [--repo PATH]
+# Point --repo at another checkout (e.g. a `git worktree` of an older commit) to compare before/after.
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+READY_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import main; main.app; "
+    "print(f'READY {(time.perf_counter() - start) * 1000:.1f}')"
+)
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str):
+    """Rebuild the import tree from `-X importtime` output as {name: (cumulative_us, children)} roots."""
+    pending = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        # Children are printed before their parent, one level deeper
+        children = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append((name, int(cumulative_us), children))
+    return pending.get(0, [])
+
+
+def run_once(repo: str):
+    """Import main:app in a fresh interpreter, returning (time-to-ready ms, import tree, error)."""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", READY_SNIPPET],
+        cwd=repo, env=env, capture_output=True, text=True,
+    )
+    roots = parse_importtime(result.stderr)
+
+    ready = re.search(r"READY ([\d.]+)", result.stdout)
+    if result.returncode != 0 or not ready:
+        error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+        return None, roots, error
+    return float(ready.group(1)), roots, None
+
+
+def print_tree(nodes, top: int, depth: int = 0, max_depth: int = 2):
+    for name, cumulative_us, children in sorted(nodes, key=lambda node: node[1], reverse=True)[:top]:
+        print(f"{'  ' * depth + name:<40} {cumulative_us / 1000:>14.1f}")
+        if depth + 1 < max_depth:
+            print_tree(children, top, depth + 1, max_depth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time-to-ready for main:app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest top-level imports to list")
+    parser.add_argument("--repo", default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+
+    ready_times = []
+    roots = []
+    for _ in range(args.runs):
+        ready_ms, roots, error = run_once(args.repo)
+        if error:
+            print(f"main:app failed to import: {error}")
+            break
+        ready_times.append(ready_ms)
+
+    if ready_times:
+        print(f"time-to-ready for main:app over {len(ready_times)} runs: "
+              f"median {statistics.median(ready_times):.1f} ms, min {min(ready_times):.1f} ms")
+
+    # Only the imports triggered by main, not interpreter startup
+    main_imports = [node for node in roots if node[0] == "main"]
+    print(f"\n{'module':<40} {'cumulative ms':>14}")
+    print_tree(main_imports, args.top, max_depth=3)
+
+if __name__ == "__main__":
+    main()
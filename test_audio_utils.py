@@ -0,0 +1,65 @@
+import base64
+import warnings
+import numpy as np
+import pytest
+from audio_utils import (AudioDirectionStats, CallAudioStats, pcm16_to_payload, pcm16_to_ulaw,
+                         resample, ulaw_codes, ulaw_to_pcm16)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop")  # Reference implementation, removed in Python 3.13
+
+ALL_SAMPLES = np.arange(-32768, 32768, dtype=np.int32).astype(np.int16)
+ALL_CODES = np.arange(256, dtype=np.uint8)
+
+
+def test_decode_matches_audioop():
+    expected = np.frombuffer(audioop.ulaw2lin(ALL_CODES.tobytes(), 2), dtype=np.int16)
+    np.testing.assert_array_equal(ulaw_to_pcm16(ALL_CODES.tobytes()), expected)
+
+
+def test_encode_matches_audioop():
+    assert pcm16_to_ulaw(ALL_SAMPLES) == audioop.lin2ulaw(ALL_SAMPLES.tobytes(), 2)
+
+
+def test_payload_round_trip():
+    codes = ALL_CODES.tobytes()
+    payload = base64.b64encode(codes).decode()
+    assert ulaw_codes(payload).tobytes() == codes
+    # Every decoded value re-encodes to a code with the same value (0x7F and 0xFF are both zero)
+    decoded = ulaw_to_pcm16(payload)
+    np.testing.assert_array_equal(ulaw_to_pcm16(pcm16_to_payload(decoded)), decoded)
+
+
+def test_resample_length_and_passthrough():
+    samples = (np.sin(np.arange(160) / 5) * 8000).astype(np.int16)
+    assert resample(samples, 8000, 24000).size == 480
+    assert resample(samples, 8000, 16000).dtype == np.int16
+    np.testing.assert_array_equal(resample(samples, 8000, 8000), samples)
+
+
+def frame(amplitude: int, samples: int = 160) -> np.ndarray:
+    pcm = (np.sin(np.arange(samples) / 3) * amplitude).astype(np.int16)
+    return np.frombuffer(pcm16_to_ulaw(pcm), dtype=np.uint8)
+
+
+def test_silence_ratio_is_weighted_by_duration():
+    stats = AudioDirectionStats()
+    stats.add(frame(0, samples=1200))  # One long silent delta
+    stats.add(frame(8000))
+    stats.add(frame(8000))
+    summary = stats.summary()
+    assert summary["frames"] == 3
+    assert summary["duration_ms"] == 190
+    assert summary["talk_ms"] == 40
+    assert summary["silence_ratio"] == pytest.approx(1200 / 1520)
+
+
+def test_clipping_and_empty_summaries():
+    stats = CallAudioStats()
+    stats.add_inbound(pcm16_to_payload(np.full(160, 32767, dtype=np.int16)))
+    summary = stats.summary()
+    assert summary["caller"]["clipping_ratio"] == 1.0
+    assert summary["caller"]["peak"] >= 32000
+    assert summary["assistant"]["rms_dbfs"] is None  # No audio, no -inf in JSON
+    assert summary["caller_talk_share"] == 1.0
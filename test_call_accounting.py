@@ -0,0 +1,83 @@
+import time
+import pytest
+import memory_manager
+from call_accounting import CallUsage, UsageStore, get_stats
+
+RESPONSE_DONE = {"type": "response.done", "response": {"status": "completed", "usage": {
+    "input_tokens": 900, "output_tokens": 300,
+    "input_token_details": {"text_tokens": 700, "audio_tokens": 200,
+                            "cached_tokens_details": {"text_tokens": 500, "audio_tokens": 0}},
+    "output_token_details": {"text_tokens": 60, "audio_tokens": 240}}}}
+
+
+def call(stream_sid: str, phone_number: str = "+1555", started_at: float = None) -> CallUsage:
+    usage = CallUsage()
+    usage.stream_sid = stream_sid
+    usage.phone_number = phone_number
+    usage.started_at = started_at or time.mktime((2024, 11, 5, 10, 0, 0, 0, 0, -1))
+    usage.record_event(RESPONSE_DONE)
+    usage.record_event({"type": "response.done", "response": {"status": "cancelled"}})
+    usage.finish({"caller": {"duration_ms": 60000}, "assistant": {"duration_ms": 30000}}, memory_index_lookups=2)
+    return usage
+
+
+def rows(store, group_by="day"):
+    return list(store.iter_usage(group_by))
+
+
+def test_tokens_and_cost():
+    usage = call("MZ1")
+    assert usage.responses == 2 and usage.cancelled_responses == 1
+    assert usage.input_audio_tokens == 200 and usage.output_audio_tokens == 240
+    # 700 text (500 of them cached), 200 audio in; 60 text, 240 audio out
+    expected = (200 * 5.00 + 500 * 2.50 + 200 * 100.00 + 60 * 20.00 + 240 * 200.00) / 1e6
+    assert usage.cost_usd == pytest.approx(expected)
+
+
+def test_daily_and_per_user_rollups(tmp_path):
+    store = UsageStore(str(tmp_path / "usage.db"))
+    store.record_many([call("MZ1"), call("MZ2", "+1666"), call("MZ3")])
+    store.record(call("MZ1"))  # Already recorded, ignored
+    [day] = rows(store)
+    assert day["day"] == "2024-11-05" and day["calls"] == 3
+    assert day["audio_in_ms"] == 180000 and day["memory_index_lookups"] == 6
+    assert {row["user_id"]: row["calls"] for row in rows(store, "user")} == {"+1555": 2, "+1666": 1}
+
+
+def test_mem0_calls_reach_the_call_and_its_day(tmp_path):
+    store = UsageStore(str(tmp_path / "usage.db"))
+    store.record_mem0_calls("MZ1")  # Shipped while the call is in progress
+    store.record_mem0_calls("MZ1")
+    store.record_many([call("MZ1"), call("MZ2", "+1666")])
+    store.record_mem0_calls("MZ1")  # Shipped after the call ended
+    store.record_mem0_calls("MZ2", calls=2)
+
+    per_user = {row["user_id"]: row["mem0_calls"] for row in rows(store, "user")}
+    assert per_user == {"+1555": 3, "+1666": 2}
+    assert store._connection().execute(
+        "SELECT mem0_calls FROM call_usage WHERE stream_sid = 'MZ1'").fetchone() == (3,)
+    assert store._connection().execute("SELECT COUNT(*) FROM pending_mem0_calls").fetchone() == (0,)
+
+
+def test_ship_to_mem0_accounts_the_add_to_its_call(tmp_path, monkeypatch):
+    class Mem0:
+        def __init__(self):
+            self.added = []
+
+        def add(self, **kwargs):
+            self.added.append(kwargs)
+
+    mem0 = Mem0()
+    store = UsageStore(str(tmp_path / "usage.db"))
+    monkeypatch.setattr(memory_manager, "_mem0_client", mem0)
+    monkeypatch.setattr(memory_manager, "get_usage_store", lambda: store)
+
+    store.record(call("MZ1"))
+    memory_manager.ship_to_mem0("+1555", "MZ1", [{"role": "user", "content": "hi"}], ["key0"])
+    memory_manager.ship_to_mem0("+1555", None, [{"role": "user", "content": "hi"}], ["key1"])
+    assert mem0.added[0]["metadata"] == {"idempotency_keys": ["key0"]}
+    assert rows(store)[0]["mem0_calls"] == 1
+
+
+def test_stats_rejects_unknown_grouping():
+    assert get_stats("week")["status"] == 400
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+import numpy as np
+from memory_index import HashingEmbedder, MemoryIndexStore, UserMemoryIndex
+
+MEMORIES = [
+    "Loves growing tomatoes in the garden",
+    "Grandson Jake plays baseball on Saturdays",
+    "Takes blood pressure medication every morning",
+    "Used to teach piano and still plays jazz",
+    "Walks to the park with the dog after lunch",
+]
+
+
+def build(texts=MEMORIES, embedder=None):
+    memories = [{"id": str(i), "memory": text} for i, text in enumerate(texts)]
+    return UserMemoryIndex.build(memories, embedder or HashingEmbedder())
+
+
+def brute_force(index, query, k):
+    """Reference top-k: every positive score, sorted."""
+    query_vector = index.embedder.embed([query])[0]
+    scores = np.asarray(index.embeddings) @ query_vector
+    order = [i for i in np.argsort(-scores, kind="stable") if scores[i] > 0]
+    return [index.texts[i] for i in order[:k]], scores
+
+
+def test_embeddings_are_normalized_and_deterministic():
+    embedder = HashingEmbedder()
+    vectors = embedder.embed(["Loves the garden", "loves THE garden!", ""])
+    assert vectors.shape == (3, embedder.dim)
+    assert vectors.dtype == np.float32
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    np.testing.assert_array_equal(vectors[0], vectors[1])  # Case and punctuation are ignored
+    assert not vectors[2].any()
+
+
+def test_stopwords_do_not_contribute():
+    embedder = HashingEmbedder()
+    np.testing.assert_array_equal(embedder.embed(["the garden of my user"]), embedder.embed(["garden"]))
+
+
+def test_search_returns_most_relevant_first():
+    index = build()
+    assert index.search("how are the tomatoes in your garden", 2)[0] == MEMORIES[0]
+    assert index.search("did jake win at baseball", 1) == [MEMORIES[1]]
+
+
+def test_search_without_overlap_or_query_is_empty():
+    index = build()
+    assert index.search("", 5) == []
+    assert index.search("the and of", 5) == []  # Only stopwords
+    assert index.search("quantum chromodynamics", 5) == []
+    assert build([]).search("garden", 5) == []
+
+
+def test_search_matches_brute_force():
+    # Small vocabulary, so most queries have many candidates within half of the best score
+    rng = np.random.default_rng(1)
+    vocabulary = "garden tomatoes piano jazz park dog tea coffee knee doctor book lake".split()
+    texts = [" ".join(rng.choice(vocabulary, size=rng.integers(2, 6))) for _ in range(2000)]
+    index = build(texts)
+    for query in texts[:200]:
+        expected, scores = brute_force(index, query, 10)
+        result = index.search(query, 10)
+        # Ties may come back in either order, so compare scores rather than texts
+        assert len(result) == len(expected)
+        np.testing.assert_allclose(sorted(scores[[texts.index(t) for t in result]]),
+                                   sorted(scores[[texts.index(t) for t in expected]]), rtol=1e-6)
+
+
+def test_search_falls_back_when_few_memories_score_near_the_best():
+    # One strong match and several weak ones: fewer than k are within half of the best score
+    texts = ["garden tomatoes peppers beans", "garden shed", "garden gloves", "garden party", "piano lessons"]
+    index = build(texts)
+    result = index.search("garden tomatoes peppers beans", 4)
+    assert result[0] == texts[0]
+    assert set(result[1:]) == set(texts[1:4])  # Equal scores, in any order
+    assert "piano lessons" not in index.search("garden tomatoes peppers beans", 10)
+
+
+def test_recent_keeps_storage_order():
+    index = build()
+    assert index.recent(2) == MEMORIES[-2:]
+    assert index.recent(10) == MEMORIES
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build()
+    index.save(str(tmp_path), "+15551234567")
+    assert sorted(os.listdir(tmp_path)) == ["+15551234567.json", "+15551234567.npy"]  # No temp files left
+
+    loaded = UserMemoryIndex.load(str(tmp_path), "+15551234567", HashingEmbedder())
+    assert isinstance(loaded.embeddings, np.memmap)
+    assert loaded.ids == index.ids and loaded.texts == index.texts
+    assert loaded.built_at == index.built_at
+    np.testing.assert_array_equal(loaded.embeddings, index.embeddings)
+    assert loaded.search("tomatoes", 1) == [MEMORIES[0]]
+
+
+def test_load_rejects_missing_or_mismatched_index(tmp_path):
+    assert UserMemoryIndex.load(str(tmp_path), "missing", HashingEmbedder()) is None
+    build().save(str(tmp_path), "user")
+    assert UserMemoryIndex.load(str(tmp_path), "user", HashingEmbedder(dim=128)) is None
+
+
+def test_store_builds_once_for_concurrent_first_lookups(tmp_path):
+    fetches = []
+
+    def fetch(user_id):
+        fetches.append(user_id)
+        time.sleep(0.1)
+        return [{"id": str(i), "memory": text} for i, text in enumerate(MEMORIES)]
+
+    store = MemoryIndexStore(fetch, directory=str(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.get("+1555"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetches == ["+1555"]
+    assert all(index is results[0] for index in results)
+
+    # A new store finds the saved index on disk without fetching again
+    fresh = MemoryIndexStore(fetch, directory=str(tmp_path))
+    assert fresh.get("+1555").texts == MEMORIES
+    assert fetches == ["+1555"]
@@ -0,0 +1,124 @@
+import threading
+import time
+from pathlib import Path
+from memory_outbox import MemoryOutbox, backfill, drain, drain_all, parse_transcription_log, turn_key
+from voice_handler import save_transcription
+
+TURNS = [
+    ("User", "user", "I planted tomatoes today"),
+    ("Assistant", "assistant", "Lovely!  How many\nplants did you put in?"),
+    ("User", "user", "yes"),
+]
+
+
+class Recorder:
+    """Stand-in for ship_to_mem0 that records every call."""
+
+    def __init__(self, fail_users=()):
+        self.calls = []
+        self.fail_users = set(fail_users)
+        self._lock = threading.Lock()
+
+    def __call__(self, user_id, conversation, messages, idempotency_keys):
+        with self._lock:
+            self.calls.append((user_id, messages, idempotency_keys))
+        if user_id in self.fail_users:
+            raise RuntimeError("Mem0 unavailable")
+
+    @property
+    def keys(self):
+        return [key for _, _, keys in self.calls for key in keys]
+
+
+def rows(count, users=3, conversations=5):
+    return [(f"key{i}", f"+1555{i % users}", f"MZ{i % conversations}", "user", f"turn {i}", 1.0 + i)
+            for i in range(count)]
+
+
+def test_turn_key_ignores_whitespace_and_subseconds():
+    key = turn_key("+1555", "MZ1", "user", "hello  there\n", 1_700_000_000.2)
+    assert key == turn_key("+1555", "MZ1", "user", "hello there", 1_700_000_000.9)
+    assert key != turn_key("+1555", "MZ1", "assistant", "hello there", 1_700_000_000.2)
+    assert key != turn_key("+1555", "MZ1", "user", "hello there", 1_700_000_001.0)
+
+
+def test_backfill_recognizes_turns_recorded_live(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    outbox = MemoryOutbox(str(tmp_path / "outbox.db"))
+    save_transcription("+1555", "", "", "MZabc", is_start=True)
+    for speaker, role, text in TURNS:
+        logged_at = save_transcription("+1555", speaker, text, "MZabc")
+        assert outbox.enqueue("+1555", role, text, conversation="MZabc", created_at=logged_at)
+    save_transcription("+1555", "", "", "MZabc", is_end=True)
+
+    [log] = Path("transcription_logs").glob("*.txt")
+    parsed = list(parse_transcription_log(log))
+    assert [(row[3], row[4]) for row in parsed] == [
+        ("user", "I planted tomatoes today"),
+        ("assistant", "Lovely!  How many\nplants did you put in?"),
+        ("user", "yes"),
+    ]
+    assert outbox.enqueue_many(parsed) == 0
+
+    ship = Recorder()
+    backfill(outbox, "transcription_logs", ship, workers=2)
+    backfill(outbox, "transcription_logs", ship, workers=2)
+    assert len(ship.keys) == 3
+    assert outbox.status() == {"pending": 0, "retrying": 0, "shipped": 3}
+
+
+def test_claimed_rows_are_not_claimed_again(tmp_path):
+    outbox = MemoryOutbox(str(tmp_path / "outbox.db"))
+    outbox.enqueue_many(rows(10))
+    first = outbox.claim(limit=4)
+    assert [row[1] for row in first] == ["key0", "key1", "key2", "key3"]
+    second = outbox.claim()
+    assert [row[1] for row in second] == [f"key{i}" for i in range(4, 10)]
+    assert outbox.claim() == []
+
+    # An expired lease (e.g. the shipping process died) makes rows claimable again
+    outbox.enqueue_many([("late", "+1", "MZ", "user", "late", 1.0)])
+    assert [row[1] for row in outbox.claim(lease=0)] == ["late"]
+    assert [row[1] for row in outbox.claim()] == ["late"]
+
+
+def test_drain_groups_batches_and_retries_failures(tmp_path):
+    outbox = MemoryOutbox(str(tmp_path / "outbox.db"))
+    outbox.enqueue_many(rows(30))
+    ship = Recorder(fail_users={"+15552"})
+    shipped, failed = drain(outbox, ship)
+    assert (shipped, failed) == (10, 5)
+    for user_id, messages, keys in ship.calls:
+        assert len(messages) == len(keys)
+        assert len({int(key[3:]) % 5 for key in keys}) == 1  # One conversation per add()
+    assert outbox.status() == {"pending": 10, "retrying": 10, "shipped": 20}
+    assert drain(outbox, ship) == (0, 0)  # Failed rows wait for their retry time
+
+
+def test_concurrent_drains_ship_each_row_once(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    MemoryOutbox(path).enqueue_many(rows(1000, users=7, conversations=31))
+    ship = Recorder()
+
+    def run():
+        drain_all(MemoryOutbox(path), ship, workers=3)
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(ship.keys) == sorted(f"key{i}" for i in range(1000))
+    assert MemoryOutbox(path).status()["shipped"] == 1000
+
+
+def test_retry_backoff_grows_with_attempts(tmp_path):
+    outbox = MemoryOutbox(str(tmp_path / "outbox.db"))
+    outbox.enqueue_many(rows(1))
+    [row] = outbox.claim()
+    for _ in range(3):
+        outbox.mark_failed([row[0]], "boom")
+    attempts, next_attempt_at = outbox._connection().execute(
+        "SELECT attempts, next_attempt_at FROM outbox").fetchone()
+    assert attempts == 3
+    assert 3 < next_attempt_at - time.time() <= 4
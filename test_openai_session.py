@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import websockets
+from openai_session import ResilientOpenAISession
+
+logging.getLogger("websockets").setLevel(logging.CRITICAL)  # The fake server's aborts are expected
+
+SESSION_UPDATE = json.dumps({"type": "session.update", "session": {}})
+
+
+class FakeServer:
+    """Runs `behaviour(server, ws, index)` for each connection and records what each one received."""
+
+    def __init__(self, behaviour, handshake_delay: float = 0):
+        self.behaviour = behaviour
+        self.handshake_delay = handshake_delay
+        self.connections = []
+        self.received = []
+
+    async def _process_request(self, path, headers):
+        if self.connections and self.handshake_delay:
+            await asyncio.sleep(self.handshake_delay)
+
+    async def _handler(self, ws):
+        index = len(self.connections)
+        self.connections.append(ws)
+        self.received.append([])
+        await self.behaviour(self, ws, index)
+
+    async def receive(self, ws, index, count: int):
+        for _ in range(count):
+            self.received[index].append(json.loads(await ws.recv()))
+
+    async def drain(self, ws, index):
+        try:
+            async for message in ws:
+                self.received[index].append(json.loads(message))
+        except websockets.ConnectionClosed:
+            pass
+
+    def serve(self):
+        return websockets.serve(self._handler, "127.0.0.1", 0, process_request=self._process_request)
+
+
+async def open_session(server, **kwargs) -> ResilientOpenAISession:
+    port = server.sockets[0].getsockname()[1]
+    session = ResilientOpenAISession(url=f"ws://127.0.0.1:{port}", backoff=[0, 0.05, 0.05], **kwargs)
+    await session.connect()
+    await session.update_session(SESSION_UPDATE)
+    return session
+
+
+async def wait_for_condition(condition, timeout: float = 5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+async def consume(session):
+    return [json.loads(message) async for message in session]
+
+
+def test_reconnect_replays_session_turns_and_buffered_audio():
+    async def behaviour(fake, ws, index):
+        if index == 0:
+            await fake.receive(ws, index, 1)
+            ws.transport.abort()
+        else:
+            await fake.drain(ws, index)
+
+    async def run():
+        fake = FakeServer(behaviour, handshake_delay=0.2)  # Keeps the upstream down long enough to buffer
+        async with fake.serve() as server:
+            session = await open_session(server)
+            session.remember_item("user", "Hello")
+            session.remember_item("assistant", "Hi there")
+            receiver = asyncio.create_task(consume(session))
+            await wait_for_condition(lambda: session._down_since is not None)
+            await session.send_audio("AAAA")  # Buffered while the upstream is down
+            await wait_for_condition(lambda: session.reconnects)
+            await session.send_audio("BBBB")
+            await asyncio.sleep(0.1)
+            await session.close()
+            await receiver
+        return fake, session
+
+    fake, session = asyncio.run(run())
+    assert len(fake.connections) == 2
+    replayed = fake.received[1]
+    assert replayed[0] == json.loads(SESSION_UPDATE)
+    assert [item["item"]["content"][0] for item in replayed[1:3]] == [
+        {"type": "input_text", "text": "Hello"}, {"type": "text", "text": "Hi there"}]
+    assert [m["audio"] for m in replayed if m["type"] == "input_audio_buffer.append"] == ["AAAA", "BBBB"]
+    assert len(session.reconnects) == 1
+
+
+def test_clean_close_ends_the_session():
+    async def behaviour(fake, ws, index):
+        await fake.receive(ws, index, 1)
+        await ws.send(json.dumps({"type": "session.created"}))
+        await ws.close()
+
+    async def run():
+        fake = FakeServer(behaviour)
+        async with fake.serve() as server:
+            session = await open_session(server)
+            messages = await asyncio.wait_for(consume(session), 5)
+        return fake, session, messages
+
+    fake, session, messages = asyncio.run(run())
+    assert messages == [{"type": "session.created"}]
+    assert len(fake.connections) == 1
+    assert not session.open
+    assert session.reconnects == []
+
+
+def test_reconnects_are_capped_per_call():
+    async def behaviour(fake, ws, index):
+        await fake.receive(ws, index, 1)
+        ws.transport.abort()
+
+    async def run():
+        fake = FakeServer(behaviour)
+        async with fake.serve() as server:
+            session = await open_session(server, max_reconnects=3)
+            await asyncio.wait_for(consume(session), 5)
+        return fake, session
+
+    fake, session = asyncio.run(run())
+    assert len(session.reconnects) == 3
+    assert len(fake.connections) == 4
+    assert not session.open
+
+
+def test_close_during_reconnect_does_not_leave_a_session_open():
+    async def behaviour(fake, ws, index):
+        if index == 0:
+            await fake.receive(ws, index, 1)
+            ws.transport.abort()
+        else:
+            await fake.drain(ws, index)
+
+    async def run():
+        fake = FakeServer(behaviour, handshake_delay=0.3)
+        async with fake.serve() as server:
+            session = await open_session(server)
+            receiver = asyncio.create_task(consume(session))
+            await asyncio.sleep(0.15)  # Second handshake in progress
+            await session.close()
+            await asyncio.wait_for(receiver, 5)
+            await asyncio.sleep(0.1)
+        return fake, session
+
+    fake, session = asyncio.run(run())
+    assert len(fake.connections) == 2
+    assert not fake.connections[1].open
+    assert fake.received[1] == []  # Nothing replayed into the abandoned session
+    assert session.reconnects == []
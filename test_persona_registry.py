@@ -0,0 +1,85 @@
+import json
+import os
+from persona_registry import DEFAULT_PERSONA_NAME, PersonaRegistry
+
+MAX = {
+    "voice": "ash",
+    "base_message": "You are MAX.",
+    "first_time_message": "Introduce yourself as Max.",
+    "returning_user_message": "Memories:\n{user_memory}\nUse them naturally.",
+}
+
+
+def write_config(path, config, mtime=None):
+    path.write_text(json.dumps(config), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+def instructions(message: str) -> str:
+    return json.loads(message)["session"]["instructions"]
+
+
+def test_missing_file_serves_default_persona(tmp_path):
+    registry = PersonaRegistry(str(tmp_path / "personas.json"), reload_interval=0)
+    assert registry.get("+15551234567").name == DEFAULT_PERSONA_NAME
+
+
+def test_numbers_map_to_personas(tmp_path):
+    path = tmp_path / "personas.json"
+    write_config(path, {"personas": {"max": MAX}, "numbers": {"+15551234567": "max", "+15550000000": "nobody"}})
+    registry = PersonaRegistry(str(path), reload_interval=0)
+
+    persona = registry.get("+15551234567")
+    assert persona.name == "max"
+    assert json.loads(persona.session_update(False))["session"]["voice"] == "ash"
+    assert json.loads(persona.session_update(False))["session"]["temperature"] == 0.8  # Inherited from Joy
+    assert registry.get("+15550000000").name == DEFAULT_PERSONA_NAME  # Unknown persona
+    assert registry.get(None).name == DEFAULT_PERSONA_NAME
+
+
+def test_memory_is_spliced_and_escaped(tmp_path):
+    path = tmp_path / "personas.json"
+    write_config(path, {"personas": {"max": MAX}, "numbers": {"+1": "max"}})
+    persona = PersonaRegistry(str(path), reload_interval=0).get("+1")
+
+    memory = ['Says "hi" to\nthe neighbours', "Likes tea \\ coffee"]
+    assert instructions(persona.session_update(True, memory)) == \
+        f"You are MAX.\n\nMemories:\n{memory}\nUse them naturally."
+    assert instructions(persona.session_update(True, [])) == "You are MAX."
+    assert instructions(persona.session_update(False)) == "You are MAX.\n\nIntroduce yourself as Max."
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    path = tmp_path / "personas.json"
+    write_config(path, {"numbers": {}}, mtime=1_000_000)
+    registry = PersonaRegistry(str(path), reload_interval=0)
+    assert registry.get("+1").name == DEFAULT_PERSONA_NAME
+
+    write_config(path, {"personas": {"max": MAX}, "numbers": {"+1": "max"}}, mtime=2_000_000)
+    assert registry.get("+1").name == "max"
+
+
+def test_persona_overriding_base_message_needs_its_own_prompts(tmp_path):
+    path = tmp_path / "personas.json"
+    write_config(path, {"personas": {"max": MAX}, "numbers": {"+1": "max"}}, mtime=1_000_000)
+    registry = PersonaRegistry(str(path), reload_interval=0)
+    assert registry.get("+1").name == "max"
+
+    # Would inherit Joy's self-introduction; rejected, and the previous configuration stays
+    incomplete = {"voice": "ash", "base_message": "You are SAM."}
+    write_config(path, {"personas": {"sam": incomplete}, "numbers": {"+1": "sam"}}, mtime=2_000_000)
+    assert registry.get("+1").name == "max"
+
+    # Overriding only the voice still inherits every Joy text
+    write_config(path, {"personas": {"sam": {"voice": "ash"}}, "numbers": {"+1": "sam"}}, mtime=3_000_000)
+    assert "Joy" in instructions(registry.get("+1").session_update(False))
+
+
+def test_example_config_loads():
+    example = os.path.join(os.path.dirname(__file__), "personas.example.json")
+    registry = PersonaRegistry(example, reload_interval=0)
+    persona = registry.get("+15551234567")
+    assert persona.name == "max"
+    assert "Joy" not in instructions(persona.session_update(False))
+    assert "likes tea" in instructions(persona.session_update(True, "likes tea"))
@@ -1,10 +1,6 @@
 from io import BytesIO
-import openai
 import os
 
-# Load API Key from environment variable
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
 async def transcribe_audio_bytes(audio_bytes: bytes, filename: str = "audio.wav") -> str:
     """
     Transcribe audio bytes using OpenAI's Whisper API.
@@ -13,6 +9,10 @@ async def transcribe_audio_bytes(audio_bytes: bytes, filename: str = "audio.wav"
     :return: Transcription text or error message.
     """
     try:
+        # Imported lazily so the realtime websocket path never pays for the openai package
+        import openai
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+
         # Ensure audio_bytes is bytes
         if not isinstance(audio_bytes, bytes):
             raise ValueError(f"Expected bytes, got {type(audio_bytes)}")
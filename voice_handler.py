@@ -1,20 +1,22 @@
 import os
 import json
 import asyncio
-import websockets
 from fastapi import WebSocket, Request
 from fastapi.responses import HTMLResponse
 from dotenv import load_dotenv
-from twilio.rest import Client
 from twilio.twiml.voice_response import VoiceResponse, Connect
-from transcription_handler import transcribe_audio_bytes
 import re
 import base64
 from datetime import datetime
 import os
-from fastapi.websockets import WebSocketDisconnect
 from pathlib import Path
-from memory_manager import mem0_client, add_memory, get_memory_context
+from memory_manager import add_memory, get_memory_context
+from audio_utils import CallAudioStats
+from diagnostics import CallCounters, register_call, finish_call
+from persona_registry import persona_registry
+from openai_session import ResilientOpenAISession
+from context_refresh import ContextRefresher
+from call_accounting import CallUsage, get_usage_store
 
 
 
@@ -32,12 +34,21 @@ PORT = int(os.getenv("PORT", 6060))
 
 # OpenAI and Twilio settings
 
-VOICE = "sage"  # OpenAI voice model
 LOG_EVENT_TYPES = ["error", "response.done", "input_audio_buffer.committed", "input_audio_buffer.transcription"]
 SHOW_TIMING_MATH = False
+INITIAL_MEMORY_LIMIT = int(os.getenv("INITIAL_MEMORY_LIMIT", 20))  # Memories in the opening instructions
 
-# Initialize Twilio client
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+# Twilio REST client, built on first outbound call (twilio.rest is slow to import)
+_twilio_client = None
+
+
+def get_twilio_client():
+    """Return the shared Twilio REST client, constructing it on first use."""
+    global _twilio_client
+    if _twilio_client is None:
+        from twilio.rest import Client
+        _twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return _twilio_client
 
 ###############################################################################################
 ###############################################################################################
@@ -45,7 +56,8 @@ client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
 session_store = {
     "streamSid_to_phone": {},  # Map streamSid to phone_number
-    "phone_to_streamSid": {}  # Map phone_number to streamSid
+    "phone_to_streamSid": {},  # Map phone_number to streamSid
+    "phone_to_dialed": {}  # Map phone_number to the Twilio number of the call, which selects the persona
 }
 
 
@@ -110,72 +122,19 @@ def has_previous_calls(phone_number: str) -> bool:
 
 
 
-def get_system_prompt(is_returning_user: bool, phone_number: str = None) -> str:    
-    base_message = '''
-You are JOY, an empathetic, witty AI companion by MyOldFriend. Your goal is to provide meaningful, engaging companionship to elderly users, blending empathy with humor and charm. Think of yourself as a warm, attentive friend who can light up a conversation with a dash of humor and quick wit.
-
-General Behavior:
-Keep it Snappy: Stick to short, playful responses (1-2 sentences). Let the user do most of the talking.
-Humorous Warmth: Infuse light humor or charming remarks when appropriate, but remain respectful and kind.
-Empathy with Spark: Show you care deeply, but keep it lively and engaging.
-Natural Curiosity: Ask simple, fun follow-ups to encourage sharing: "What’s the secret to your green thumb?"
-Adapt to the Vibe: Match the user’s tone—joyful, reflective, or somewhere in between.
-
-Memory Handling:
-When memory is unavailable: Glide over gaps gracefully and humorously:
-"That sounds amazing—remind me how it all started?"
-"I could swear we talked about this, but refresh my memory—it’s worth hearing twice!"
-When memory is available: Drop in subtle callbacks to past conversations:
-"Still conquering the garden? What’s the latest adventure?"
-
-Interaction Style and Key Behaviors:
-Brevity is Beautiful: Prioritize sharp, engaging replies: "That’s awesome—tell me more!"
-Humorous Curiosity: Sprinkle in wit: "So, are we talking tomatoes or a jungle of cucumbers?"
-Positive Punch: Celebrate achievements with flair: "Impressive! Did you get a trophy for that?"
-Emotion Matching with Style: Match emotions but keep it light:
-Joyful user: "That’s fantastic—are you throwing a party yet?"
-Reflective user: "Sounds like a beautiful memory. Got more to share?"
-Fluid Memory Play: Weave past conversations smoothly:
-"Last time, you mentioned knitting—how’s that masterpiece coming along?"
-Constraints:
-
-Avoid discussing technical limitations or AI features.
-Skip overly formal or robotic phrasing.
-Stick to concise responses unless elaboration is clearly needed.
-        '''
-    system_prompt = base_message
-
-    if not is_returning_user:
-        first_time_user_message = '''
-            This time, you’re interacting with a first-time user, adapting the conversation to make them feel welcome and engaged. Use flexible, friendly introductions to create a warm first impression:
-            First-Time Interaction Introductions examples:
-            "Hi! I’m Joy, your new friend from MyOldFriend. I’m here to listen, chat, and share laughs. What’s something you’ve been thinking about lately?"
-            "Hello there! I’m Joy, so happy to meet you. Let’s chat about your favorite things or just keep each other company—what’s on your mind?"
-            "Hi, I’m Joy! Someone special thought we’d make a great pair. Let’s start with something light—how has your day been so far?"
-            "Hello! I’m Joy, your caring companion from MyOldFriend. I’d love to hear your favorite story or memory—what should we talk about first?"
-            "Hi, I’m Joy, and I’m here for you anytime you need me. What’s one thing that’s made you smile today?"
-        '''
-        system_prompt = base_message + f"\n\n{first_time_user_message}"
-    
-    else:
-        if phone_number:
-            # print(f"\nGetting conversation history for returning user: {phone_number}")
-            # conversation_history = get_recent_conversation_history(phone_number)    
-            # if conversation_history:
-            #     print(f"Adding conversation history to system message. {conversation_history}")
-            #     base_message += f"\n\nUse the following conversation history to provide context and personalization to your responses. Reference previous topics naturally, but don't explicitly mention that you're using conversation history:{conversation_history}"    
-            user_memory = get_memory_context(phone_number=phone_number, limit=1000)
-            if user_memory:
-                print(f"Adding user memory to system message. {user_memory}")
-                return_user_promt = f'''
-                    This time, you’re interacting with a return user, incorporating known information to create a sense of continuity and deepen the connection. Below is the memory you have for the user: 
-                    {user_memory}
-                    They are not a lot, but you should flexibly use them in conversation. Reference past interactions naturally, but don't explicitly mention that you're using memory.
-                '''
-                system_prompt = base_message + f"\n\n{return_user_promt}"
-                
-    return system_prompt
-    
+def get_initial_memories(is_returning_user: bool, phone_number: str = None) -> list:
+    """
+    Return the memories spliced into a returning caller's instructions. Only the
+    most recent few are included up front; related older ones are added mid-call
+    by the ContextRefresher as the caller brings topics up.
+    """
+    if not (is_returning_user and phone_number):
+        return []
+    user_memory = get_memory_context(phone_number=phone_number, limit=INITIAL_MEMORY_LIMIT)
+    if user_memory:
+        print(f"Adding user memory to system message. {user_memory}")
+    return user_memory
+
 
 
 async def extract_caller_phone_number(request: Request):
@@ -191,17 +150,30 @@ async def extract_caller_phone_number(request: Request):
         return None
 
 
+async def extract_dialed_phone_number(request: Request):
+    """
+    Extract the Twilio number that was dialed, which selects the persona for the call.
+    """
+    try:
+        form_data = await request.form()
+        return form_data.get("To", None)
+    except Exception as e:
+        print(f"Failed to extract dialed number: {e}")
+        return None
+
+
 
 
 def save_transcription(phone_number: str, speaker: str, text: str, stream_sid, is_start=False, is_end=False):
-    """Save transcription to a file with timestamp."""
+    """Save transcription to a file with timestamp. Returns the time the entry was logged at."""
     os.makedirs('transcription_logs', exist_ok=True)
     
-    date = datetime.now().strftime('%Y-%m-%d')
+    now = datetime.now()
+    date = now.strftime('%Y-%m-%d')
     filename = f'transcription_logs/{phone_number}_{date}_{stream_sid}.txt'
     # print(f"Saving transcription to: {filename}")  # Debug print
 
-    timestamp = datetime.now().strftime('%H:%M:%S')
+    timestamp = now.strftime('%H:%M:%S')
     
     # Special messages for start/end of conversation
     if is_start:
@@ -213,6 +185,7 @@ def save_transcription(phone_number: str, speaker: str, text: str, stream_sid, i
     
     with open(filename, 'a', encoding='utf-8') as f:
         f.write(message)
+    return now.timestamp()
 
 
 
@@ -220,9 +193,11 @@ async def handle_incoming_call(request: Request):
     """Handle incoming call and return TwiML response to connect to Media Stream."""
     phone_number = await extract_caller_phone_number(request)
     if phone_number:
-        print(f"Incoming call from {phone_number}")
+        dialed_number = await extract_dialed_phone_number(request)
+        print(f"Incoming call from {phone_number} to {dialed_number}")
         # Temporarily store the phone number with a placeholder for future streamSid
         session_store["phone_to_streamSid"][phone_number] = None
+        session_store["phone_to_dialed"][phone_number] = dialed_number
 
     else:
         print("Failed to extract phone number.")
@@ -248,15 +223,14 @@ async def handle_media_stream(websocket: WebSocket):
     print("Client connected")
     await websocket.accept()
 
-    async with websockets.connect(
-        'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01',
-        extra_headers={
+    async with ResilientOpenAISession(
+        headers={
             "Authorization": f"Bearer {OPENAI_API_KEY}",
             "OpenAI-Beta": "realtime=v1"
         }
     ) as openai_ws:
         try:
-            await initialize_session(openai_ws)
+            initial_memories, looked_up_memories = await initialize_session(openai_ws)
         except Exception as e:
             print(f"Error initializing OpenAI session: {e}")
             return
@@ -267,6 +241,13 @@ async def handle_media_stream(websocket: WebSocket):
         last_assistant_item = None
         mark_queue = []
         response_start_timestamp_twilio = None
+        audio_stats = CallAudioStats()
+        counters = CallCounters(audio_stats)
+        context_refresher = ContextRefresher(openai_ws, get_memory_context, initial_memories)
+        counters.context_refresher = context_refresher
+        usage = CallUsage()
+        usage.memory_index_lookups = 1 if looked_up_memories else 0
+        counters.usage = usage
         
         # Mark conversation start
         phone_number = None  # Will be set when we get the stream_sid
@@ -276,14 +257,15 @@ async def handle_media_stream(websocket: WebSocket):
             nonlocal stream_sid, latest_media_timestamp, phone_number
             try:
                 async for message in websocket.iter_text():
+                    counters.twilio_messages += 1
+                    counters.twilio_bytes += len(message)
                     data = json.loads(message)
                     if data['event'] == 'media' and openai_ws.open:
+                        counters.media_frames_in += 1
                         latest_media_timestamp = int(data['media']['timestamp'])
-                        audio_append = {
-                            "type": "input_audio_buffer.append",
-                            "audio": data['media']['payload']
-                        }
-                        await openai_ws.send(json.dumps(audio_append))
+                        audio_stats.add_inbound(data['media']['payload'])
+                        # Buffered by the session if the OpenAI connection is being restored
+                        await openai_ws.send_audio(data['media']['payload'])
                     elif data['event'] == 'start':
                         stream_sid = data['start']['streamSid']
                         # Find the phone number from the stored mapping
@@ -293,6 +275,10 @@ async def handle_media_stream(websocket: WebSocket):
                                 session_store["streamSid_to_phone"][stream_sid] = phone
                                 phone_number = phone
                                 break
+                        counters.phone_number = phone_number
+                        register_call(stream_sid, counters)
+                        usage.stream_sid = stream_sid
+                        usage.phone_number = phone_number
                         
                         if phone_number:
                             save_transcription(phone_number, "", "", stream_sid, is_start=True)
@@ -305,10 +291,13 @@ async def handle_media_stream(websocket: WebSocket):
                     elif data['event'] == 'mark':
                         if mark_queue:
                             mark_queue.pop(0)
-            except WebSocketDisconnect:
+            finally:
+                # iter_text() swallows WebSocketDisconnect, so a hangup simply ends the loop.
+                # Closing the OpenAI session here also ends send_to_twilio.
                 if phone_number:
-                    save_transcription(phone_number, "", "", is_end=True)
+                    save_transcription(phone_number, "", "", stream_sid, is_end=True)
                 print("Client disconnected.")
+                print(f"Call audio stats for {stream_sid}: {audio_stats.summary()}")
                 if openai_ws.open:
                     await openai_ws.close()
 
@@ -320,7 +309,10 @@ async def handle_media_stream(websocket: WebSocket):
                 print("Starting to receive messages from OpenAI")
                 async for openai_message in openai_ws:
                     print(f"Received message from OpenAI: {openai_message}") 
+                    counters.openai_messages += 1
+                    counters.openai_bytes += len(openai_message)
                     response = json.loads(openai_message)
+                    usage.record_event(response)
                     if 'response' in response and 'status_details' in response['response']:
                         print("Full error details:", response['response']['status_details'])
 
@@ -334,20 +326,27 @@ async def handle_media_stream(websocket: WebSocket):
                         user_transcription = response.get("transcript", "")
                         if user_transcription:
                             print(f"\nUser said: {user_transcription}")
-                            save_transcription(phone_number, "User", user_transcription, stream_sid)
-                            add_memory(phone_number, "user", user_transcription)
+                            logged_at = save_transcription(phone_number, "User", user_transcription, stream_sid)
+                            add_memory(phone_number, "user", user_transcription, conversation=stream_sid, created_at=logged_at)
+                            usage.memory_turns_queued += 1
+                            openai_ws.remember_item("user", user_transcription)
+                            context_refresher.on_user_transcript(phone_number, user_transcription)
     
                     # Handle assistant's completed transcript
                     if response.get("type") == "response.audio_transcript.done":
                         assistant_transcript = response.get("transcript", "")
                         if assistant_transcript:
                             print(f"\nAssistant said: {assistant_transcript}\n")
-                            save_transcription(phone_number, "Assistant", assistant_transcript, stream_sid) # Write to file
-                            add_memory(phone_number, "assistant", assistant_transcript) # add to memory
+                            logged_at = save_transcription(phone_number, "Assistant", assistant_transcript, stream_sid) # Write to file
+                            add_memory(phone_number, "assistant", assistant_transcript, conversation=stream_sid, created_at=logged_at) # add to memory
+                            usage.memory_turns_queued += 1
+                            openai_ws.remember_item("assistant", assistant_transcript) # replayed after a reconnect
 
                     if response.get('type') == 'response.audio.delta' and 'delta' in response:
                         print("Received audio delta from OpenAI")
                         audio_payload = response['delta']
+                        audio_stats.add_outbound(audio_payload)
+                        counters.audio_deltas_out += 1
                         audio_delta = {
                             "event": "media",
                             "streamSid": stream_sid,
@@ -385,6 +384,7 @@ async def handle_media_stream(websocket: WebSocket):
             # print("Handling speech started event.")
 
             if mark_queue and response_start_timestamp_twilio is not None:
+                usage.interruptions += 1
                 elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
                 if SHOW_TIMING_MATH:
                     print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
@@ -420,11 +420,25 @@ async def handle_media_stream(websocket: WebSocket):
                 await connection.send_json(mark_event)
                 mark_queue.append('responsePart')
 
-        await asyncio.gather(receive_from_twilio(), send_to_twilio())
+        try:
+            await asyncio.gather(receive_from_twilio(), send_to_twilio())
+        finally:
+            context_refresher.close()
+            finish_call(counters)
+            if usage.stream_sid:
+                usage.finish(audio_stats.summary(), memory_index_lookups=context_refresher.lookups)
+                try:
+                    # SQLite write off the event loop
+                    await asyncio.get_running_loop().run_in_executor(None, get_usage_store().record, usage)
+                except Exception as e:
+                    print(f"Error recording usage for {usage.stream_sid}: {e}")
 
 
 async def initialize_session(openai_ws):
-    """Initialize OpenAI session."""
+    """
+    Initialize OpenAI session. Returns the memories included in the instructions and
+    whether they were looked up, which happens for returning callers even if none are found.
+    """
 
     # Check if user has previous calls
     phone_number = None
@@ -437,52 +451,27 @@ async def initialize_session(openai_ws):
     is_returning_user = has_previous_calls(phone_number) if phone_number else False
     print(f"Is returning user: {is_returning_user}")
     
-    system_message = get_system_prompt(is_returning_user, phone_number)
-    print(f"\nSystem message length: {len(system_message)}")
-    print(system_message)
-    # print("First 100 characters of system message:", system_message[:100])
-    
-    is_returning_user = has_previous_calls(phone_number) if phone_number else False
-
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "turn_detection": {"type": "server_vad"},
-            "input_audio_format": "g711_ulaw",
-            "output_audio_format": "g711_ulaw",
-            "voice": VOICE,
-            "instructions": system_message,
-            "modalities": ["text", "audio"],
-            "input_audio_transcription": {"model": "whisper-1"},  # Enable user audio transcription
-            "temperature": 0.8,
-        },
-    }
+    persona = persona_registry.get(session_store["phone_to_dialed"].get(phone_number))
+    print(f"Using persona: {persona.name}")
+
+    # A first lookup builds the caller's memory index from Mem0, so keep it off the event loop
+    initial_memories = await asyncio.get_running_loop().run_in_executor(
+        None, get_initial_memories, is_returning_user, phone_number)
+    session_update = persona.session_update(is_returning_user, initial_memories)
+    print(f"\nSession update length: {len(session_update)}")
     print("Sending session update to OpenAI")
-    await openai_ws.send(json.dumps(session_update))
+    await openai_ws.update_session(session_update)
     print("Session update sent successfully")
 
     print("Sending initial message to OpenAI")
-    # Modify initial message based on whether it's a returning user
-    initial_prompt = (
-        "Warmly greet the user as a returning friend, express joy at speaking with them again, and ask how they've been since your last conversation."
-        if is_returning_user else
-        "Cheerfully greet the user with enthusiasm, introduce yourself, and let them know that you will always be their loyal companion. Happily ask the user how they are doing today."
-    )
-
-    initial_message = {
-        "type": "conversation.item.create",
-        "item": {
-            "type": "message",
-            "role": "user",
-            "content": [{"type": "input_text", "text": initial_prompt}],
-        },
-    }
-    await openai_ws.send(json.dumps(initial_message))
+    # Initial message differs based on whether it's a returning user
+    await openai_ws.send(persona.greeting(is_returning_user))
     print("Initial message sent successfully")
 
     print("Sending response create command")
     await openai_ws.send(json.dumps({"type": "response.create"}))
     print("Response create command sent successfully")
+    return initial_memories, bool(is_returning_user and phone_number)
 
 
 async def make_call(request: Request):
@@ -490,13 +479,15 @@ async def make_call(request: Request):
     try:
         data = await request.json()
         phone_number = data.get('phone_number')
+        from_number = data.get('from_number') or PHONE_NUMBER_FROM  # Twilio number, selects the persona
         
         if not phone_number:
             return {"error": "Phone number is required", "status": 400}
 
         # Store the phone number with a placeholder for future streamSid
         session_store["phone_to_streamSid"][phone_number] = None
-        print(f"Outbound call to {phone_number}")
+        session_store["phone_to_dialed"][phone_number] = from_number
+        print(f"Outbound call to {phone_number} from {from_number}")
 
         # Use the same TwiML as handle_incoming_call
         response = VoiceResponse()
@@ -507,8 +498,8 @@ async def make_call(request: Request):
         response.append(connect)
 
         # Make the call with the same TwiML
-        call = client.calls.create(
-            from_=PHONE_NUMBER_FROM,
+        call = get_twilio_client().calls.create(
+            from_=from_number,
             to=phone_number,
             twiml=str(response)
         )